@@ -0,0 +1,68 @@
+"""Local stand-in for a scenario MCP server, for benchmarks.
+
+It has the same shape as demo/ny_voting/server.py (resource://init,
+resource://next_timestep, one prompt per demographic feature and a news search
+tool) but answers instantly from canned data, or after BENCH_TOOL_LATENCY
+seconds for tool calls. run_bench.py loads it in-process.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from fastmcp import FastMCP
+
+mcp = FastMCP(name="Benchmark Server")
+
+TOOL_LATENCY = float(os.environ.get("BENCH_TOOL_LATENCY", "0.05"))
+
+DEMOGRAPHIC_INFO = [
+    [["Democrat", 68], ["Republican", 12], ["Independent", 20]],
+    [["White", 32], ["Black", 24], ["Hispanic", 29], ["Asian", 14], ["Other", 1]],
+    [["Manhattan", 19], ["Brooklyn", 31], ["Queens", 27], ["Bronx", 17], ["Staten Island", 6]],
+]
+OPTIONS = ["Andrew Cuomo", "Zohran Mamdani", "Eric Adams", "Curtis Sliwa"]
+
+timestep = 0
+start_date = datetime(2025, 5, 10)
+
+
+@mcp.tool()
+async def search_election_news(query: str, max_results: int = 5) -> dict:
+    """Search for news about the election on the current day."""
+    if TOOL_LATENCY:
+        await asyncio.sleep(TOOL_LATENCY)
+    date = (start_date + timedelta(days=timestep - 1)).strftime("%Y-%m-%d")
+    results = [
+        {"title": f"{query} update {i}", "url": f"https://example.com/{date}/{i}", "published_date": date,
+         "source": "example.com", "snippet": f"Coverage of {query} on {date}. " * 20}
+        for i in range(max_results)
+    ]
+    return {"query": query, "date": date, "results_count": len(results), "results": results}
+
+
+@mcp.resource("resource://init")
+def init() -> dict:
+    return {
+        "context": "This is a simulation of the New York City mayoral elections. You are going to pretend to be a person, whose demographics will be given to you.",
+        "demographic_info": DEMOGRAPHIC_INFO,
+        "options": OPTIONS,
+    }
+
+
+@mcp.resource("resource://next_timestep")
+def next_timestep() -> str:
+    global timestep
+    timestep += 1
+    date = (start_date + timedelta(days=timestep - 1)).strftime("%Y-%m-%d")
+    return f"The current day is {date}, news searches will be for this specific date."
+
+
+def _add_feature_prompt(name):
+    def prompt() -> str:
+        return f"You are {name}. " + "People like you care about housing, transit and public safety. " * 5
+    mcp.add_prompt(prompt, name=name)
+
+
+for category in DEMOGRAPHIC_INFO:
+    for feature, _ in category:
+        _add_feature_prompt(feature)
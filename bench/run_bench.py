@@ -0,0 +1,236 @@
+"""End-to-end benchmark of the simulation client, without network or API keys.
+
+Drives client_server's /init and /run_turn in-process against the mock LLM
+backend and the mock MCP server (mock_server.py), at each population size:
+
+    python bench/run_bench.py                                  # 100, 1k and 10k agents
+    python bench/run_bench.py --agents 1000 --latency 0.5 --rate-limit 0.01
+    python bench/run_bench.py --compare bench/results/baseline.json
+
+For every size it reports agents/sec, p50/p99 agent-turn latency, peak RSS
+and event-loop lag, and writes everything to bench/results/ as JSON. With
+--compare it flags (and exits non-zero on) results that regressed by more
+than --threshold against an earlier run, e.g. one saved as baseline.json
+from a known-good commit.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+# (metric, True if higher is better)
+COMPARED = [
+    ("agents_per_sec", True),
+    ("p50_agent_seconds", False),
+    ("p99_agent_seconds", False),
+    ("init_seconds", False),
+    ("loop_lag_p99_ms", False),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--turns", type=int, default=2, help="turns to run per population size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.2, help="median mock LLM latency in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="lognormal spread of the LLM latency")
+    parser.add_argument("--tool-prob", type=float, default=0.3, help="chance a decision round calls an MCP tool")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of LLM calls that get a 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="retry-after of injected 429s in seconds")
+    parser.add_argument("--tool-latency", type=float, default=0.05, help="mock MCP tool latency in seconds")
+    parser.add_argument("--max-in-flight", type=int, default=2000, help="LLM scheduler concurrency cap")
+    parser.add_argument("--out", help="results file (default: bench/results/bench-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change counted as a regression")
+    return parser.parse_args()
+
+
+def configure_env(args):
+    """ Points the client at the mocks; must run before the client modules are imported. """
+    os.environ.update({
+        "LLM_BACKEND": "mock",
+        "MCP_TRANSPORT": "inprocess",
+        "MCP_SERVER": os.path.join(BENCH_DIR, "mock_server.py:mcp"),
+        "BENCH_TOOL_LATENCY": str(args.tool_latency),
+        "LLM_MAX_IN_FLIGHT": str(args.max_in_flight),
+        "LLM_RPM": "100000000",
+        "LLM_INPUT_TPM": "100000000000",
+        "LLM_OUTPUT_TPM": "100000000000",
+        "CASSETTE_MODE": "off",
+    })
+    os.environ.pop("TRACE_FILE", None)
+    os.environ.pop("CHECKPOINT_PATH", None)
+    sys.path.insert(0, os.path.join(ROOT, "client"))
+
+
+class LoopLagMonitor:
+    """ Samples how late the event loop wakes a task that sleeps `interval` seconds. """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.lags = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self):
+        self.lags = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def bench_size(client, num_agents, args, metrics):
+    monitor = LoopLagMonitor()
+    monitor.start()
+    start = time.perf_counter()
+    response = await client.request("GET", "/init", json={"num_people": num_agents, "seed": args.seed})
+    response.raise_for_status()
+    init_seconds = time.perf_counter() - start
+
+    calls_before = metrics.llm_request_seconds.count()
+    rate_limited_before = metrics.llm_rate_limited_total.total()
+    turn_seconds, p50s, p99s = [], [], []
+    for _ in range(args.turns):
+        start = time.perf_counter()
+        response = await client.get("/run_turn")
+        response.raise_for_status()
+        turn_seconds.append(time.perf_counter() - start)
+        p50s.append(metrics.last_turn_agent_seconds.value(quantile=0.5))
+        p99s.append(metrics.last_turn_agent_seconds.value(quantile=0.99))
+    await monitor.stop()
+
+    total = sum(turn_seconds)
+    return {
+        "agents": num_agents,
+        "turns": args.turns,
+        "init_seconds": round(init_seconds, 4),
+        "turn_seconds": [round(t, 4) for t in turn_seconds],
+        "agents_per_sec": round(num_agents * args.turns / total, 2),
+        "p50_agent_seconds": round(_percentile(p50s, 0.5), 4),
+        "p99_agent_seconds": round(max(p99s), 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "loop_lag_p99_ms": round(1000 * _percentile(monitor.lags, 0.99), 2),
+        "loop_lag_max_ms": round(1000 * max(monitor.lags, default=0.0), 2),
+        "llm_calls": metrics.llm_request_seconds.count() - calls_before,
+        "rate_limited": metrics.llm_rate_limited_total.total() - rate_limited_before,
+    }
+
+
+async def run(args):
+    import httpx
+    import client_server
+    import metrics
+    from config import ConcurrencyConfig
+    from llm import LLMClient, MockBackend, set_llm
+    from population import DEFAULT_OPTIONS
+    from scheduler import LLMScheduler
+
+    set_llm(LLMClient(
+        MockBackend(DEFAULT_OPTIONS, latency=args.latency, seed=args.seed, latency_sigma=args.latency_sigma,
+                    tool_use_prob=args.tool_prob, rate_limit_prob=args.rate_limit, retry_after=args.retry_after),
+        LLMScheduler(ConcurrencyConfig.from_env()),
+    ))
+    await client_server.startup_event()
+    results = []
+    try:
+        transport = httpx.ASGITransport(app=client_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for num_agents in sorted(args.agents):
+                result = await bench_size(client, num_agents, args, metrics)
+                print(f"{num_agents:>7} agents: {result['agents_per_sec']:>9.1f} agents/s  "
+                      f"p50 {result['p50_agent_seconds']:.3f}s  p99 {result['p99_agent_seconds']:.3f}s  "
+                      f"init {result['init_seconds']:.2f}s  rss {result['peak_rss_mb']:.0f}MB  "
+                      f"loop lag p99 {result['loop_lag_p99_ms']:.1f}ms max {result['loop_lag_max_ms']:.1f}ms  "
+                      f"429s {result['rate_limited']}")
+                results.append(result)
+    finally:
+        await client_server.shutdown_event()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """ Prints the metrics that got worse than the baseline by more than `threshold`; returns how many. """
+    with open(baseline_path) as f:
+        baseline = {r["agents"]: r for r in json.load(f)["results"]}
+    regressions = 0
+    for result in results:
+        before = baseline.get(result["agents"])
+        if before is None:
+            continue
+        for metric, higher_is_better in COMPARED:
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > threshold:
+                regressions += 1
+                print(f"REGRESSION {result['agents']} agents {metric}: {old} -> {new} ({100 * change:+.1f}%)")
+    print(f"{regressions} regressions against {baseline_path}")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    configure_env(args)
+    results = asyncio.run(run(args))
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "threshold")},
+        "results": results,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import random
+import re
+from collections import Counter
+
+from config import ActivationConfig
+
+NEW = "new"
+IDLE = "idle"
+UNSTABLE = "unstable"
+RELEVANT = "relevant"
+REFRESH = "refresh"
+
+
+def context_text(ctx):
+    """ Flattens a turn context (a string or resource contents) into lowercase text. """
+    if isinstance(ctx, str):
+        return ctx.lower()
+    return " ".join(getattr(content, "text", None) or "" for content in ctx).lower()
+
+
+def _mentions(text, phrase):
+    return re.search(r"\b" + re.escape(phrase.lower()) + r"\b", text) is not None
+
+
+class ActivationPolicy:
+    """ Picks the agents that run a full call_llm this turn (see ActivationConfig).
+
+    Per-agent state lives on the agents (`last_active`, `unchanged`) so it's
+    checkpointed with them.
+    """
+
+    def __init__(self, config: ActivationConfig = None, seed=None):
+        self.config = config or ActivationConfig.from_env()
+        self.rng = random.Random(seed)
+
+    def reason(self, person, text, turn):
+        """ Why `person` should run this turn, or None to leave it idle. """
+        config = self.config
+        if person.last_active is None:
+            return NEW
+        if turn - person.last_active >= config.max_idle:
+            return IDLE
+        if person.unchanged < config.stable_after:
+            return UNSTABLE
+        if any(_mentions(text, feature) for feature in person.features) or _mentions(text, person.decision):
+            return RELEVANT
+        if self.rng.random() < config.refresh_rate:
+            return REFRESH
+        return None
+
+    def select(self, people, ctx, turn):
+        """ Returns (active indices, Counter of activation reasons). Without a turn
+        number there's no activation history to go by, so everyone runs. """
+        if self.config.policy == "all" or turn is None:
+            return list(range(len(people))), Counter({"all": len(people)})
+        if self.config.policy != "sparse":
+            raise ValueError(f"Unknown ACTIVATION_POLICY: {self.config.policy}")
+        text = context_text(ctx)
+        active = []
+        reasons = Counter()
+        for i, person in enumerate(people):
+            reason = self.reason(person, text, turn)
+            if reason is not None:
+                active.append(i)
+                reasons[reason] += 1
+        return active, reasons
+
+    @staticmethod
+    def record(person, previous_decision, turn):
+        """ Updates an agent's activation state after it finished a turn. """
+        person.unchanged = person.unchanged + 1 if person.decision == previous_decision else 0
+        person.last_active = turn
@@ -0,0 +1,45 @@
+from config import ArchetypeConfig
+
+
+def archetype_key(person):
+    """ Everything that goes into an agent's requests besides the shared turn context. """
+    return (tuple(person.features), person.sys_prompt, person.decision, str(person.memory),
+            person.temp, person.model, person.memory_model, person.memory_mode, person.max_tokens)
+
+
+def plan_archetypes(people, indices, config: ArchetypeConfig = None):
+    """ Splits the agents at `indices` into runners and followers.
+
+    Agents are grouped by `archetype_key`; the first `config.samples` of each
+    group run their turn and the others are dealt round-robin to them.
+
+    Returns:
+        (runners, followers), where followers maps a runner to the agents that copy its outcome.
+    """
+    config = config or ArchetypeConfig.from_env()
+    if config.samples <= 0:
+        return list(indices), {}
+    groups = {}
+    for i in indices:
+        groups.setdefault(archetype_key(people[i]), []).append(i)
+    runners = []
+    followers = {}
+    for members in groups.values():
+        sampled = members[:config.samples]
+        runners.extend(sampled)
+        for n, j in enumerate(members[len(sampled):]):
+            followers.setdefault(sampled[n % len(sampled)], []).append(j)
+    return sorted(runners), followers
+
+
+def fan_out(source, members):
+    """ Gives `members` the decision and memories `source` ended its turn with.
+
+    The memories are copied as they stand, without waiting for a compaction `source`
+    may be running: that stays background work, and the members fold their copy
+    themselves once they add to it.
+    """
+    state = source.memory.to_state()
+    for person in members:
+        person.decision = source.decision
+        person.memory.load_state(state)
@@ -9,4 +9,22 @@ Based on this conversation, create a brief, meaningful memory that captures the
 Write in first person perspective as if you are the assistant remembering this interaction.
 Focus only on what's important to remember for future reference, and keep this concise - under 100 words, but even shorter
 is better. Avoid outputting any other text than the memory.
-"""
\ No newline at end of file
+"""
+
+summary_prompt = """
+You are a memory consolidation system for an AI assistant. Below are several of the assistant's memories, oldest first.
+
+{memories}
+
+Merge them into a single memory that keeps the key facts, opinions and decisions, and how they changed over time.
+Write in first person perspective as if you are the assistant remembering.
+Keep it under {max_words} words. Avoid outputting any other text than the memory.
+"""
+
+
+record_memory_instruction = """
+
+When you have finished reading and deciding for today, your final action must be a call to the record_memory tool.
+Write a brief, meaningful memory of today that captures the key information, insights, or decisions, in first person
+perspective, under 100 words (shorter is better). Do not call any other tool after record_memory.
+"""
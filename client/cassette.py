@@ -0,0 +1,138 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from collections import Counter
+
+from anthropic.types import Message
+from mcp.types import CallToolResult
+
+logger = logging.getLogger(__name__)
+
+RECORD = "record"
+REPLAY = "replay"
+
+
+class CassetteMiss(KeyError):
+    """ Raised in replay mode for a call that was never recorded. """
+
+
+def _jsonable(value):
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    return str(value)
+
+
+class CassetteStore:
+    """ Recorded LLM and MCP tool calls in a SQLite file, keyed by a hash of the request.
+
+    Agents with the same features and memories send byte-identical requests, so each
+    recording is also numbered by how many times its request had been seen before.
+    Replay hands the n-th identical request the n-th recorded answer, and since every
+    later request embeds the earlier answers, each agent keeps following one recorded
+    trajectory even when agents finish in a different order than they did when recording.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS calls (digest TEXT NOT NULL, occurrence INTEGER NOT NULL, "
+            "kind TEXT NOT NULL, request TEXT NOT NULL, response TEXT NOT NULL, PRIMARY KEY (digest, occurrence))"
+        )
+        self.db.commit()
+        self._lock = threading.Lock()
+        self._seen = Counter()
+
+    def key(self, kind, request):
+        """ Returns (digest, occurrence) for the next call of `kind` with `request`. """
+        encoded = json.dumps([kind, request], sort_keys=True, default=_jsonable)
+        digest = hashlib.sha256(encoded.encode()).hexdigest()
+        occurrence = self._seen[digest]
+        self._seen[digest] += 1
+        return digest, occurrence
+
+    def get(self, digest, occurrence):
+        """ Returns the recorded response, falling back to another recording of the same
+        request when this one was seen fewer times while recording. """
+        with self._lock:
+            row = self.db.execute(
+                "SELECT response FROM calls WHERE digest = ? ORDER BY occurrence = ? DESC, occurrence LIMIT 1",
+                (digest, occurrence),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, digest, occurrence, kind, request, response):
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO calls (digest, occurrence, kind, request, response) VALUES (?, ?, ?, ?, ?)",
+                (digest, occurrence, kind, json.dumps(request, default=_jsonable), response),
+            )
+            self.db.commit()
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+
+_stores = {}
+
+
+def open_cassette(path) -> CassetteStore:
+    """ Returns the process-wide store for `path`, shared by the LLM backend and MCP session. """
+    if path not in _stores:
+        _stores[path] = CassetteStore(path)
+    return _stores[path]
+
+
+class CassetteBackend:
+    """ LLM backend wrapper: records `messages.create` calls to the store, or replays them
+    without a backend at all. """
+
+    def __init__(self, backend, store: CassetteStore, mode):
+        self.backend = backend
+        self.store = store
+        self.mode = mode
+
+    async def create(self, **kwargs):
+        digest, occurrence = self.store.key("messages.create", kwargs)
+        if self.mode == REPLAY:
+            recorded = self.store.get(digest, occurrence)
+            if recorded is None:
+                raise CassetteMiss(f"No recorded messages.create for request {digest[:12]}")
+            return Message.model_validate_json(recorded)
+        response = await self.backend.create(**kwargs)
+        self.store.put(digest, occurrence, "messages.create", kwargs, response.model_dump_json())
+        return response
+
+    async def aclose(self):
+        if self.backend is not None:
+            await self.backend.aclose()
+
+
+class CassetteSession:
+    """ MCP session wrapper that records or replays `call_tool`; everything else
+    (prompts, resources, the simulation clock) still goes to the session. """
+
+    def __init__(self, session, store: CassetteStore, mode):
+        self.session = session
+        self.store = store
+        self.mode = mode
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    async def call_tool(self, name, arguments=None):
+        request = {"name": name, "arguments": arguments}
+        digest, occurrence = self.store.key("call_tool", request)
+        if self.mode == REPLAY:
+            recorded = self.store.get(digest, occurrence)
+            if recorded is None:
+                raise CassetteMiss(f"No recorded call_tool {name} for request {digest[:12]}")
+            return CallToolResult.model_validate_json(recorded)
+        result = await self.session.call_tool(name, arguments)
+        self.store.put(digest, occurrence, "call_tool", request, result.model_dump_json())
+        return result
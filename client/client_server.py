@@ -1,13 +1,20 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks
-from pydantic import BaseModel
-from typing import List, Tuple, Dict, Any, Optional
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response
 import json
-import random
+import os
 import asyncio
 from contextlib import AsyncExitStack
-from mcp import ClientSession
-from mcp.client.sse import sse_client
-from person import PersonV2
+from models import InitRequest, InitResponse, RunTurnResponse, EstimateTurnResponse, CheckpointRequest
+from population import build_population, DEFAULT_OPTIONS
+from llm import get_llm
+from transport import open_mcp_session
+from turn import iter_turn, TurnTally, DONE, STRAGGLER, INACTIVE
+import metrics
+from jobs import JobQueue
+from state_store import snapshot_state, write_state, load_state
+from config import EstimateConfig
+from estimator import VoteShareEstimator, stratified_order, estimate_turn
+from results_store import ResultsStore, encode, JSON
 
 app = FastAPI()
 
@@ -19,17 +26,20 @@ import traceback, sys, asyncio
 # Global variables to store state
 mcp_session = None
 people = []
+feature_codes = None  # (num_people, num_categories) indices into demographic_info
+demographic_features = None
+turn = 0
+# Written at the end of every turn when set, so a crashed run can be resumed with /resume
+checkpoint_path = os.environ.get("CHECKPOINT_PATH")
 next_turn_uri = "resource://next_timestep"
 exit_stack = None
-
-class InitRequest(BaseModel):
-    num_people: int
-
-class InitResponse(BaseModel):
-    people: List[Tuple[int, List[str]]]
-
-class RunTurnResponse(BaseModel):
-    updates: List[Tuple[int, Dict[str, Any], str]]
+job_queue = JobQueue()
+# Held from start_turn to end_turn (and while the population is replaced), so turns from
+# /run_turn, /run_turn/stream, /run_turn/estimate and background jobs never overlap
+turn_lock = asyncio.Lock()
+sample_order = None  # stratified agent order for /run_turn/estimate, kept across turns as a panel
+last_estimate = None
+results = None  # ResultsStore of every agent's decision after each turn, for /analytics
 
 @app.on_event("startup")
 async def startup_event():
@@ -37,15 +47,8 @@ async def startup_event():
     exit_stack = AsyncExitStack()
     
     try:
-        print("Starting SSE client...")
-        sse_transport = await exit_stack.enter_async_context(sse_client("http://127.0.0.1:8000/sse"))
-        read_stream, write_stream = sse_transport
-        
-        # Create a ClientSession with the streams
-        mcp_session = await exit_stack.enter_async_context(ClientSession(read_stream, write_stream))
-        
-        # Initialize the session
-        await mcp_session.initialize()
+        print("Starting MCP client pool...")
+        mcp_session = await open_mcp_session(exit_stack)
         print("MCP session initialized successfully")
     except Exception as e:
         print(f"Error initializing MCP session: {e}")
@@ -59,54 +62,44 @@ async def shutdown_event():
     if exit_stack:
         await exit_stack.aclose()
         print("MCP session closed")
+    await job_queue.close()
+    await get_llm().aclose()
 
 @app.get("/init", response_model=InitResponse)
 async def init(request: InitRequest):
-    global mcp_session, people
+    global mcp_session, people, feature_codes, demographic_features, turn, sample_order, last_estimate, results
     
     if not mcp_session:
         raise HTTPException(status_code=500, detail="MCP session not initialized")
     
-    try:
-        # Clear existing people if any
-        people = []
+    async with turn_lock:
+        try:
+            # Clear existing people if any
+            people = []
         
-        # Get features from resource
-        features = await mcp_session.read_resource("resource://init")
-        features_json = json.loads(features.contents[0].text)
-        demographic_features = features_json['demographic_info']
-        base_prompt = features_json['context']
-        options = ["Andrew Cuomo", "Zohran Mamdani", "Eric Adams", "Curtis Sliwa", "Undecided"] # Should update to get this from mcp resource
-        for i in range(request.num_people):
-            # Sample features for each person
-            sampled_features = []
-            for feature_category in demographic_features:
-                feature_names = [item[0] for item in feature_category]
-                probabilities = [item[1] for item in feature_category]
-                
-                # Normalize probabilities
-                total = sum(probabilities)
-                normalized_probs = [p/total for p in probabilities]
-                
-                # Sample one feature based on probabilities
-                selected_feature = random.choices(feature_names, weights=normalized_probs, k=1)[0]
-                sampled_features.append(selected_feature)
-            
-            # Create a new person with sampled features
-            person = PersonV2(sampled_features)
-            await person.generate_sys_prompt(base_prompt, mcp_session, options)
-            people.append(person)
+            # Get features from resource
+            features = await mcp_session.read_resource("resource://init")
+            features_json = json.loads(features.contents[0].text)
+            demographic_features = features_json['demographic_info']
+            base_prompt = features_json['context']
+            options = DEFAULT_OPTIONS
+            people, feature_codes = await build_population(
+                mcp_session, demographic_features, base_prompt, options, request.num_people, request.seed)
+            turn = 0
+            sample_order = last_estimate = None
+            results = ResultsStore(demographic_features, feature_codes, options)
+            results.record(turn, people)
         
-        # Prepare response with person IDs and their features
-        response_data = [(i, person.features) for i, person in enumerate(people)]
-        return InitResponse(people=response_data)
+            # Prepare response with person IDs and their features
+            response_data = [(i, person.features) for i, person in enumerate(people)]
+            return InitResponse(people=response_data)
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error initializing people: {str(e)}")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error initializing people: {str(e)}")
 
-@app.get("/run_turn", response_model=RunTurnResponse)
-async def run_turn():
-    global mcp_session, people, next_turn_uri
+async def start_turn():
+    """ Checks that a turn can run, then advances the simulation and returns the new turn context. """
+    global mcp_session, people, next_turn_uri, turn
     
     if not mcp_session:
         raise HTTPException(status_code=500, detail="MCP session not initialized")
@@ -114,26 +107,277 @@ async def run_turn():
     if not people:
         raise HTTPException(status_code=400, detail="No people initialized. Call /init first.")
     
-    # Get the next turn context
-    new_turn_ctx = await mcp_session.read_resource(next_turn_uri)
-    
-    # Create tasks for all persons
-    tasks = [person.call_llm(mcp_session, new_turn_ctx.contents) for person in people]
+    # Revalidate cached tools/prompts once for the whole turn
+    await mcp_session.refresh()
+
+    # Get the next turn context. Reading it advances the server's clock, so it's never
+    # retried: a retry after a lost response would silently skip a day.
+    try:
+        new_turn_ctx = await mcp_session.read_resource(next_turn_uri, retry=False)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Reading {next_turn_uri} failed, the server's clock may have advanced: {e!r}")
+    turn += 1
+    return new_turn_ctx
+
+async def end_turn():
+    """ Records the turn's decisions for /analytics, and checkpoints the population
+    after the turn if CHECKPOINT_PATH is set. """
+    results.record(turn, people)
+    if checkpoint_path:
+        await save_checkpoint(checkpoint_path)
+
+async def save_checkpoint(path):
+    # Snapshot on the loop so the next turn can't change agents mid-write, then write in a thread
+    arrays = snapshot_state(people, feature_codes, demographic_features, turn)
+    await asyncio.to_thread(write_state, path, arrays)
+
+@app.get("/run_turn", response_model=RunTurnResponse)
+async def run_turn():
+    async with turn_lock:
+        new_turn_ctx = await start_turn()
     
-    # Wait for all tasks to complete
-    results = await asyncio.gather(*tasks)
+        # Run the activated people's turns; stragglers and inactive agents come back flagged
+        formatted_results = []
+        stragglers = []
+        inactive = []
+        async for person_id, decision, memory_update, status in iter_turn(people, mcp_session, new_turn_ctx.contents, turn=turn):
+            formatted_results.append((person_id, {"memory": memory_update}, decision))
+            if status == STRAGGLER:
+                stragglers.append(person_id)
+            elif status == INACTIVE:
+                inactive.append(person_id)
     
-    # Format the results as [(id, memory_update, decision)]
-    formatted_results = []
-    for i, result in enumerate(results):
-        # PersonV2.call_llm returns a tuple of (decision, new_memory)
-        person_id = i
-        decision, memory_update = result
-        formatted_results.append((person_id, {"memory": memory_update}, decision))
+        # Format the results as [(id, memory_update, decision)], in id order
+        formatted_results.sort(key=lambda update: update[0])
     
-    return RunTurnResponse(updates=formatted_results)
+        await end_turn()
+        return RunTurnResponse(updates=formatted_results, stragglers=stragglers, inactive=inactive)
+
+@app.get("/run_turn/stream")
+async def run_turn_stream():
+    """ Streams the turn as NDJSON: one line per agent as soon as it finishes, carrying
+    its (id, memory_update, decision) and the running tallies, then a final summary line.
+    Agents the activation policy skipped come first, as "inactive" lines with their current
+    decision; agents cut off by the turn policy come last, as "straggler" lines with their previous decision.
+    If the turn can't start, the only line is an "error" one with the status and detail /run_turn would return. """
+    # The lock is taken and released in the body only: if the client leaves before the body
+    # is iterated, nothing has started and nothing is held
+    async def lines():
+        async with turn_lock:
+            try:
+                new_turn_ctx = await start_turn()
+            except HTTPException as e:
+                yield json.dumps({"type": "error", "status": e.status_code, "detail": e.detail}) + "\n"
+                return
+            tally = TurnTally(len(people))
+            async for person_id, decision, memory_update, status in iter_turn(people, mcp_session, new_turn_ctx.contents, turn=turn):
+                tally.add(decision, status)
+                yield json.dumps({
+                    "type": "result" if status == DONE else status,
+                    "id": person_id,
+                    "memory_update": {"memory": memory_update},
+                    "decision": decision,
+                    **tally.to_dict()
+                }) + "\n"
+            await end_turn()
+            yield json.dumps({"type": "done", **tally.to_dict()}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
     
 
+@app.get("/run_turn/estimate", response_model=EstimateTurnResponse)
+async def run_turn_estimate():
+    """ Runs the turn on a stratified sample of agents only, growing it batch by batch until
+    the reweighted vote-share intervals reach ESTIMATE_TARGET_WIDTH (see EstimateConfig).
+    Agents outside the sample sit the turn out and aren't in the updates. """
+    global sample_order, last_estimate
+    async with turn_lock:
+        new_turn_ctx = await start_turn()
+        config = EstimateConfig.from_env()
+        if sample_order is None:
+            sample_order = stratified_order(feature_codes, config.seed)
+        estimator = VoteShareEstimator(demographic_features, people[0].options, config.confidence)
+
+        formatted_results = []
+        stragglers = []
+        inactive = []
+        async for person_id, decision, memory_update, status in estimate_turn(
+                people, feature_codes, sample_order, mcp_session, new_turn_ctx.contents, estimator, config, turn=turn):
+            formatted_results.append((person_id, {"memory": memory_update}, decision))
+            if status == STRAGGLER:
+                stragglers.append(person_id)
+            elif status == INACTIVE:
+                inactive.append(person_id)
+        formatted_results.sort(key=lambda update: update[0])
+
+        estimate = estimator.estimate()
+        last_estimate = {"turn": turn, **estimate}
+        await end_turn()
+        return EstimateTurnResponse(
+            updates=formatted_results, stragglers=stragglers, inactive=inactive, sampled=len(formatted_results),
+            converged=estimator.converged(estimate, config), estimate=estimate)
+
+@app.get("/estimate")
+async def get_estimate():
+    """ Vote-share intervals from the last /run_turn/estimate. """
+    if last_estimate is None:
+        raise HTTPException(status_code=404, detail="No estimate yet. Call /run_turn/estimate first.")
+    return last_estimate
+
+@app.post("/checkpoint")
+async def checkpoint(request: CheckpointRequest):
+    """ Saves the population (features, decisions, memories, turn) to disk. """
+    path = request.path or checkpoint_path
+    if not path:
+        raise HTTPException(status_code=400, detail="No checkpoint path given and CHECKPOINT_PATH is not set")
+    if not people:
+        raise HTTPException(status_code=400, detail="No people initialized. Call /init first.")
+    async with turn_lock:
+        await save_checkpoint(path)
+        return {"path": path, "turn": turn, "num_people": len(people)}
+
+@app.post("/resume", response_model=InitResponse)
+async def resume(request: CheckpointRequest):
+    """ Reloads a checkpointed population in place of /init. """
+    global people, feature_codes, demographic_features, turn, sample_order, last_estimate, results
+    path = request.path or checkpoint_path
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"No checkpoint at {path}")
+    async with turn_lock:
+        people, feature_codes, demographic_features, turn = await asyncio.to_thread(load_state, path)
+        sample_order = last_estimate = None
+        # Decisions of earlier turns aren't checkpointed; analytics start from the resumed turn
+        results = ResultsStore(demographic_features, feature_codes, people[0].options)
+        results.record(turn, people)
+        return InitResponse(people=[(i, person.features) for i, person in enumerate(people)])
+
+@app.post("/jobs/init")
+async def submit_init_job(request: InitRequest):
+    """ Queues an /init in the background and returns its job immediately. """
+    async def run(job):
+        job.total = request.num_people
+        response = await init(request)
+        job.results = response.people
+        job.done = len(response.people)
+
+    return job_queue.submit("init", run, request.model_dump()).summary()
+
+@app.post("/jobs/run_turn")
+async def submit_turn_jobs(turns: int = 1):
+    """ Queues `turns` turns to run back to back in the background, one job per turn. """
+    async def run(job):
+        async with turn_lock:
+            new_turn_ctx = await start_turn()
+            job.total = len(people)
+            async for person_id, decision, memory_update, status in iter_turn(people, mcp_session, new_turn_ctx.contents, turn=turn):
+                job.results.append((person_id, {"memory": memory_update}, decision))
+                if status == STRAGGLER:
+                    job.stragglers.append(person_id)
+                elif status == INACTIVE:
+                    job.inactive.append(person_id)
+                job.done += 1
+            await end_turn()
+
+    return [job_queue.submit("run_turn", run).summary() for _ in range(turns)]
+
+@app.get("/jobs")
+async def list_jobs():
+    return [job.summary() for job in job_queue.jobs.values()]
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, offset: int = 0):
+    """ Job status, progress and results from `offset` on; poll with the last offset + len(results). """
+    if job_id not in job_queue.jobs:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job_queue.jobs[job_id].to_dict(offset)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    if job_id not in job_queue.jobs:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job_queue.cancel(job_id).summary()
+
+def analytics_response(payload, format):
+    """ Encodes an analytics payload as JSON or msgpack (?format=msgpack). """
+    try:
+        body, media_type = encode(payload, format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(body, media_type=media_type)
+
+def require_results():
+    if results is None:
+        raise HTTPException(status_code=400, detail="No people initialized. Call /init first.")
+    return results
+
+@app.get("/analytics/tallies")
+async def analytics_tallies(turn: int = None, format: str = JSON):
+    """ Decision counts after `turn` (default: the latest). """
+    store = require_results()
+    try:
+        return analytics_response({"turn": turn if turn is not None else store.turns[-1], "options": store.options,
+                                   "counts": store.tallies(turn)}, format)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Turn {turn} not recorded")
+
+@app.get("/analytics/crosstab")
+async def analytics_crosstab(category: int, turn: int = None, format: str = JSON):
+    """ Decision counts per feature of demographic category `category` (an index into demographic_info). """
+    store = require_results()
+    if not 0 <= category < len(store.demographic_features):
+        raise HTTPException(status_code=404, detail=f"Unknown category {category}")
+    try:
+        return analytics_response({
+            "turn": turn if turn is not None else store.turns[-1],
+            "features": [name for name, _ in store.demographic_features[category]],
+            "options": store.options,
+            "counts": store.crosstab(category, turn),
+        }, format)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Turn {turn} not recorded")
+
+@app.get("/analytics/switches")
+async def analytics_switches(from_turn: int, to_turn: int = None, format: str = JSON):
+    """ How many agents went from each decision after `from_turn` to each decision after
+    `to_turn` (default: the latest); rows are the earlier decision. """
+    store = require_results()
+    try:
+        return analytics_response({
+            "from_turn": from_turn,
+            "to_turn": to_turn if to_turn is not None else store.turns[-1],
+            "options": store.options,
+            "counts": store.switches(from_turn, to_turn),
+        }, format)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Turn not recorded")
+
+@app.get("/analytics/series")
+async def analytics_series(format: str = JSON):
+    """ Decision counts after every recorded turn, one row per turn. """
+    store = require_results()
+    return analytics_response({"turns": store.turns, "options": store.options, "counts": store.series()}, format)
+
+@app.get("/analytics/columns")
+async def analytics_columns(turn: int = None, format: str = JSON):
+    """ The raw columns: every agent's decision code after `turn` and its feature codes,
+    for dashboards that slice the population themselves. """
+    store = require_results()
+    try:
+        return analytics_response({
+            "turn": turn if turn is not None else store.turns[-1],
+            "options": store.options,
+            "demographic_info": store.demographic_features,
+            "decisions": store.decisions(turn),
+            "feature_codes": store.feature_codes,
+        }, format)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Turn {turn} not recorded")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """ Prometheus text exposition of LLM, MCP, memory and turn metrics. """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 
 if __name__ == "__main__":
     import uvicorn
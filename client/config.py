@@ -0,0 +1,197 @@
+import os
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+@dataclass
+class ConcurrencyConfig:
+    """Limits for the calls we make to the LLM provider.
+
+    The defaults are sized for a mid-tier Anthropic account; override them
+    with the LLM_* environment variables to match your own rate limits.
+    """
+    max_in_flight: int = 64
+    min_in_flight: int = 4
+    requests_per_minute: int = 4000
+    input_tokens_per_minute: int = 400_000
+    output_tokens_per_minute: int = 80_000
+    max_retries: int = 6
+    base_backoff: float = 1.0
+    max_backoff: float = 60.0
+    pool_size: int = 100
+    keepalive_expiry: float = 30.0
+    http2: bool = True
+    # Decision calls still running past this percentile of recent latencies get a
+    # second, hedged request; the first response wins. 0 disables hedging.
+    hedge_percentile: float = 0.0
+    hedge_min_samples: int = 100
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_in_flight=_env_int("LLM_MAX_IN_FLIGHT", cls.max_in_flight),
+            min_in_flight=_env_int("LLM_MIN_IN_FLIGHT", cls.min_in_flight),
+            requests_per_minute=_env_int("LLM_RPM", cls.requests_per_minute),
+            input_tokens_per_minute=_env_int("LLM_INPUT_TPM", cls.input_tokens_per_minute),
+            output_tokens_per_minute=_env_int("LLM_OUTPUT_TPM", cls.output_tokens_per_minute),
+            max_retries=_env_int("LLM_MAX_RETRIES", cls.max_retries),
+            base_backoff=_env_float("LLM_BASE_BACKOFF", cls.base_backoff),
+            max_backoff=_env_float("LLM_MAX_BACKOFF", cls.max_backoff),
+            pool_size=_env_int("LLM_POOL_SIZE", cls.pool_size),
+            keepalive_expiry=_env_float("LLM_KEEPALIVE_EXPIRY", cls.keepalive_expiry),
+            http2=os.environ.get("LLM_HTTP2", "1") != "0",
+            hedge_percentile=_env_float("LLM_HEDGE_PERCENTILE", cls.hedge_percentile),
+            hedge_min_samples=_env_int("LLM_HEDGE_MIN_SAMPLES", cls.hedge_min_samples),
+        )
+
+
+@dataclass
+class TurnConfig:
+    """When a turn stops waiting for slow agents (TURN_* environment variables).
+
+    Each agent-turn is cut off after `agent_deadline` seconds (0 = no deadline). Once
+    a `quorum` share of the agents has finished, the rest get `quorum_grace` more
+    seconds before the turn closes without them. Agents cut off either way keep
+    their previous decision and are reported as stragglers.
+    """
+    agent_deadline: float = 0.0
+    quorum: float = 1.0
+    quorum_grace: float = 0.0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            agent_deadline=_env_float("TURN_AGENT_DEADLINE", cls.agent_deadline),
+            quorum=_env_float("TURN_QUORUM", cls.quorum),
+            quorum_grace=_env_float("TURN_QUORUM_GRACE", cls.quorum_grace),
+        )
+
+
+@dataclass
+class MCPConfig:
+    """Connection settings for the simulation's MCP server (MCP_* environment variables).
+
+    `transport` is "sse" (connect to `url`), "stdio" (spawn `command` in `cwd`) or
+    "inprocess" (load `server`, e.g. "../demo/ny_voting/server.py:mcp", into this process).
+    """
+    transport: str = "sse"
+    url: str = "http://127.0.0.1:8000/sse"
+    command: str = "python main.py stdio"
+    cwd: str = None
+    server: str = None
+    pool_size: int = 4
+    request_timeout: float = 120.0
+    health_interval: float = 15.0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            transport=os.environ.get("MCP_TRANSPORT", cls.transport),
+            url=os.environ.get("MCP_URL", cls.url),
+            command=os.environ.get("MCP_COMMAND", cls.command),
+            cwd=os.environ.get("MCP_CWD", cls.cwd),
+            server=os.environ.get("MCP_SERVER", cls.server),
+            pool_size=_env_int("MCP_POOL_SIZE", cls.pool_size),
+            request_timeout=_env_float("MCP_REQUEST_TIMEOUT", cls.request_timeout),
+            health_interval=_env_float("MCP_HEALTH_INTERVAL", cls.health_interval),
+        )
+
+
+@dataclass
+class ActivationConfig:
+    """Which agents run each turn (ACTIVATION_* environment variables).
+
+    With `policy` "all" every agent runs every turn. With "sparse" an agent only runs
+    when something might change its mind: it has never run, it has been idle for
+    `max_idle` turns, its decision changed within its last `stable_after` runs, the
+    turn context mentions one of its features or its current choice, or it's picked
+    for a random refresh (`refresh_rate`). Everyone else carries their state forward.
+    """
+    policy: str = "all"
+    max_idle: int = 5
+    stable_after: int = 2
+    refresh_rate: float = 0.05
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            policy=os.environ.get("ACTIVATION_POLICY", cls.policy),
+            max_idle=_env_int("ACTIVATION_MAX_IDLE", cls.max_idle),
+            stable_after=_env_int("ACTIVATION_STABLE_AFTER", cls.stable_after),
+            refresh_rate=_env_float("ACTIVATION_REFRESH_RATE", cls.refresh_rate),
+        )
+
+
+@dataclass
+class ArchetypeConfig:
+    """Deduplication of agents in identical states (ARCHETYPE_* environment variables).
+
+    Agents with the same features, memories, decision and sampling settings would
+    send byte-identical requests. With `samples` > 0, at most that many of them run
+    their turn and the rest copy one of their outcomes, so a group only splits up
+    as far as its sampled outcomes differ. 0 runs every agent.
+    """
+    samples: int = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(samples=_env_int("ARCHETYPE_SAMPLES", cls.samples))
+
+
+@dataclass
+class EstimateConfig:
+    """Vote-share estimation from a sample of agents (ESTIMATE_* environment variables).
+
+    A turn run with /run_turn/estimate launches agents in batches of `batch_size`,
+    drawn in stratified order, and stops once every interval at `confidence` is at
+    most `target_width` wide, after at least `min_samples` agents. `scope` "overall"
+    only checks the population-wide shares; "features" also checks the shares within
+    each demographic feature.
+    """
+    target_width: float = 0.1
+    confidence: float = 0.95
+    batch_size: int = 100
+    min_samples: int = 100
+    scope: str = "overall"
+    seed: int = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            target_width=_env_float("ESTIMATE_TARGET_WIDTH", cls.target_width),
+            confidence=_env_float("ESTIMATE_CONFIDENCE", cls.confidence),
+            batch_size=_env_int("ESTIMATE_BATCH", cls.batch_size),
+            min_samples=_env_int("ESTIMATE_MIN_SAMPLES", cls.min_samples),
+            scope=os.environ.get("ESTIMATE_SCOPE", cls.scope),
+            seed=_env_int("ESTIMATE_SEED", cls.seed),
+        )
+
+
+@dataclass
+class CassetteConfig:
+    """Record/replay of LLM and MCP tool calls (CASSETTE_* environment variables).
+
+    `mode` is "off", "record" (make real calls and store them in the SQLite file at
+    `path`) or "replay" (answer only from `path`; no LLM or tool calls are made).
+    """
+    mode: str = "off"
+    path: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassette.sqlite3")
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mode=os.environ.get("CASSETTE_MODE", cls.mode),
+            path=os.environ.get("CASSETTE_PATH", cls.path),
+        )
@@ -0,0 +1,173 @@
+from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import os
+import sys
+from contextlib import AsyncExitStack
+
+import httpx
+import numpy as np
+
+from config import ConcurrencyConfig
+from models import InitRequest, InitResponse, RunTurnResponse
+from population import sample_features, build_combos, DEFAULT_OPTIONS
+from transport import open_mcp_session
+
+# Coordinator for running one simulation across several worker processes or hosts.
+# It serves the same /init and /run_turn API as client_server.py, but the agents
+# live on workers (worker.py), each with its own LLM client and MCP sessions.
+#
+#   WORKER_URLS=http://host-a:3100,http://host-b:3100   use already running workers
+#   COORDINATOR_WORKERS=8                                or spawn this many local workers
+#
+# Workers must all reach the same scenario server (MCP_TRANSPORT=sse), since the
+# coordinator advances its clock once per turn on behalf of everyone.
+app = FastAPI()
+
+mcp_session = None
+exit_stack = None
+workers = []  # worker base URLs
+shard_workers = []  # the workers holding agents; with fewer agents than workers some hold none
+worker_procs = []
+http = None
+num_people = 0
+turn = 0
+next_turn_uri = "resource://next_timestep"
+# Held through /init and /run_turn, so turns never overlap (each advances the shared clock)
+# and the shards are never replaced under a running turn
+turn_lock = asyncio.Lock()
+
+
+def _worker_env(num_workers):
+    """ Splits the provider rate limits evenly between local workers. """
+    config = ConcurrencyConfig.from_env()
+    return {
+        **os.environ,
+        "LLM_MAX_IN_FLIGHT": str(max(1, config.max_in_flight // num_workers)),
+        "LLM_MIN_IN_FLIGHT": str(max(1, config.min_in_flight // num_workers)),
+        "LLM_RPM": str(max(1, config.requests_per_minute // num_workers)),
+        "LLM_INPUT_TPM": str(max(1, config.input_tokens_per_minute // num_workers)),
+        "LLM_OUTPUT_TPM": str(max(1, config.output_tokens_per_minute // num_workers)),
+        "LLM_POOL_SIZE": str(max(1, config.pool_size // num_workers)),
+    }
+
+
+async def spawn_workers(num_workers, base_port):
+    env = _worker_env(num_workers)
+    client_dir = os.path.dirname(os.path.abspath(__file__))
+    for i in range(num_workers):
+        port = base_port + i
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "uvicorn", "worker:app", "--host", "127.0.0.1", "--port", str(port),
+            cwd=client_dir, env=env,
+        )
+        worker_procs.append(proc)
+        workers.append(f"http://127.0.0.1:{port}")
+
+
+async def wait_for_workers(timeout=60.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    for url in workers:
+        while True:
+            try:
+                (await http.get(f"{url}/health")).raise_for_status()
+                break
+            except httpx.HTTPError:
+                if asyncio.get_running_loop().time() > deadline:
+                    raise RuntimeError(f"Worker {url} did not come up within {timeout}s")
+                await asyncio.sleep(0.5)
+
+
+async def _post_all(path, bodies, urls=None):
+    """ POSTs bodies[i] to urls[i] (default: every worker) concurrently and returns the JSON responses. """
+    urls = workers if urls is None else urls
+    async def post(url, body):
+        response = await http.post(f"{url}{path}", json=body)
+        if response.status_code != 200:
+            raise HTTPException(status_code=502, detail=f"Worker {url}{path} failed: {response.text}")
+        return response.json()
+
+    return await asyncio.gather(*(post(url, body) for url, body in zip(urls, bodies)))
+
+
+@app.on_event("startup")
+async def startup_event():
+    global mcp_session, exit_stack, http
+    exit_stack = AsyncExitStack()
+    mcp_session = await open_mcp_session(exit_stack)
+    http = httpx.AsyncClient(timeout=None)
+
+    urls = os.environ.get("WORKER_URLS")
+    if urls:
+        workers.extend(url.strip().rstrip("/") for url in urls.split(",") if url.strip())
+    else:
+        num_workers = int(os.environ.get("COORDINATOR_WORKERS", str(os.cpu_count() or 1)))
+        await spawn_workers(num_workers, int(os.environ.get("WORKER_BASE_PORT", "3100")))
+    await wait_for_workers()
+    print(f"Coordinator ready with {len(workers)} workers")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for proc in worker_procs:
+        proc.terminate()
+    await asyncio.gather(*(proc.wait() for proc in worker_procs))
+    if http:
+        await http.aclose()
+    if exit_stack:
+        await exit_stack.aclose()
+
+@app.get("/init", response_model=InitResponse)
+async def init(request: InitRequest):
+    """ Samples the population here, then hands each worker a contiguous shard of it. """
+    global num_people, turn, shard_workers
+    async with turn_lock:
+        features = await mcp_session.read_resource("resource://init")
+        features_json = json.loads(features.contents[0].text)
+        demographic_features = features_json['demographic_info']
+        base_prompt = features_json['context']
+
+        codes = sample_features(demographic_features, request.num_people, request.seed)
+        combo_features, combo_prompts, inverse = await build_combos(mcp_session, demographic_features, base_prompt, codes)
+        combos = [list(pair) for pair in zip(combo_features, combo_prompts)]
+
+        shards = np.array_split(np.arange(request.num_people), len(workers))
+        await _post_all("/shard/load", [
+            {
+                "options": DEFAULT_OPTIONS,
+                "combos": combos,
+                "agents": list(zip(shard.tolist(), inverse[shard].tolist())),
+            }
+            for shard in shards
+        ])
+        num_people = request.num_people
+        turn = 0
+        shard_workers = [url for url, shard in zip(workers, shards) if len(shard)]
+        return InitResponse(people=[(i, combo_features[combo]) for i, combo in enumerate(inverse.tolist())])
+
+@app.get("/run_turn", response_model=RunTurnResponse)
+async def run_turn():
+    """ Advances the simulation once, broadcasts the turn context and merges every worker's updates. """
+    global turn
+    async with turn_lock:
+        if not num_people:
+            raise HTTPException(status_code=400, detail="No people initialized. Call /init first.")
+        await mcp_session.refresh()
+        # Never retried: reading it advances the server's clock
+        try:
+            new_turn_ctx = await mcp_session.read_resource(next_turn_uri, retry=False)
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Reading {next_turn_uri} failed, the server's clock may have advanced: {e!r}")
+        ctx = [content.model_dump(mode="json") for content in new_turn_ctx.contents]
+        turn += 1
+
+        responses = await _post_all("/shard/run_turn", [{"ctx": ctx, "turn": turn}] * len(shard_workers), shard_workers)
+        updates = sorted((tuple(update) for response in responses for update in response["updates"]), key=lambda u: u[0])
+        stragglers = sorted(i for response in responses for i in response.get("stragglers", []))
+        inactive = sorted(i for response in responses for i in response.get("inactive", []))
+        return RunTurnResponse(updates=updates, stragglers=stragglers, inactive=inactive)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=3001)
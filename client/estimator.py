@@ -0,0 +1,168 @@
+import asyncio
+from dataclasses import replace
+from statistics import NormalDist
+
+import numpy as np
+
+from config import EstimateConfig, TurnConfig
+from mcp_cache import MCPCache
+from metrics import TurnTimer
+from turn import iter_turn, STRAGGLER, INACTIVE
+import metrics
+import tracing
+
+
+def stratified_order(feature_codes, seed=None):
+    """ Orders the agents so that every prefix is a proportionally stratified sample.
+
+    Each feature combination (cell) is shuffled, and its k-th agent is placed at
+    about k / cell size along the order, so cells enter the sample in proportion to
+    their size. The order is meant to be kept across turns, making the sample a panel
+    that is only extended when a turn needs more agents.
+    """
+    rng = np.random.default_rng(seed)
+    _, inverse, counts = np.unique(feature_codes, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    rank = np.empty(len(inverse))
+    for cell in range(len(counts)):
+        members = np.flatnonzero(inverse == cell)
+        rank[members] = rng.permutation(len(members))
+    priority = (rank + rng.random(len(inverse))) / counts[inverse]
+    return np.argsort(priority, kind="stable")
+
+
+class VoteShareEstimator:
+    """ Post-stratified vote shares with normal-approximation confidence intervals.
+
+    Each sampled cell's shares are weighted by the cell's population weight, the
+    product of its features' `demographic_info` weights, renormalized over the
+    cells sampled so far. Interval variances use shares smoothed by half a vote,
+    so cells with one or two agents don't claim to be certain.
+    """
+
+    def __init__(self, demographic_features, options, confidence=0.95):
+        self.demographic_features = demographic_features
+        self.weights = [np.array([w for _, w in category], dtype=float) for category in demographic_features]
+        self.weights = [w / w.sum() for w in self.weights]
+        self.options = list(options)
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.codes = []
+        self.choices = []
+
+    @property
+    def n(self):
+        return len(self.choices)
+
+    def add(self, codes, decision):
+        if decision not in self.options:
+            self.options.append(decision)
+        self.codes.append(list(codes))
+        self.choices.append(self.options.index(decision))
+
+    def _shares(self, codes, choices):
+        """ Returns (shares, half widths) over `options` for the sampled rows given. """
+        cells, inverse = np.unique(codes, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        weight = np.ones(len(cells))
+        for j, w in enumerate(self.weights):
+            weight *= w[cells[:, j]]
+        weight /= weight.sum()
+        counts = np.zeros((len(cells), len(self.options)))
+        np.add.at(counts, (inverse, choices), 1)
+        n_cell = counts.sum(axis=1)
+        shares = weight @ (counts / n_cell[:, None])
+        smoothed = (counts + 0.5) / (n_cell[:, None] + 1)
+        variance = (weight ** 2 / n_cell) @ (smoothed * (1 - smoothed))
+        return shares, self.z * np.sqrt(variance)
+
+    def _intervals(self, codes, choices):
+        shares, half = self._shares(codes, choices)
+        return {
+            option: {
+                "share": round(float(share), 4),
+                "low": round(float(max(0.0, share - h)), 4),
+                "high": round(float(min(1.0, share + h)), 4),
+            }
+            for option, share, h in zip(self.options, shares, half)
+        }
+
+    def estimate(self):
+        """ Overall and per-feature intervals, e.g. {"overall": {option: {share, low, high}},
+        "by_feature": {feature: {option: ...}}, "samples": n, "feature_samples": {feature: n}}. """
+        codes = np.asarray(self.codes, dtype=np.int64).reshape(-1, len(self.weights))
+        choices = np.asarray(self.choices, dtype=np.int64)
+        result = {"samples": self.n, "overall": {}, "by_feature": {}, "feature_samples": {}}
+        if not self.n:
+            return result
+        result["overall"] = self._intervals(codes, choices)
+        for j, category in enumerate(self.demographic_features):
+            for code in np.unique(codes[:, j]).tolist():
+                mask = codes[:, j] == code
+                name = category[code][0]
+                result["by_feature"][name] = self._intervals(codes[mask], choices[mask])
+                result["feature_samples"][name] = int(mask.sum())
+        return result
+
+    def width(self, estimate, scope="overall"):
+        """ Widest interval in `estimate`, over the overall shares or also every feature's. """
+        groups = [estimate["overall"]]
+        if scope == "features":
+            groups.extend(estimate["by_feature"].values())
+        return max((i["high"] - i["low"] for group in groups for i in group.values()), default=1.0)
+
+    def converged(self, estimate, config: EstimateConfig):
+        """ Whether `estimate` is tight enough to stop launching agents. """
+        return self.n >= config.min_samples and self.width(estimate, config.scope) <= config.target_width
+
+
+async def estimate_turn(people, feature_codes, order, mcp_session: MCPCache, ctx,
+                        estimator: VoteShareEstimator, config: EstimateConfig = None,
+                        policy: TurnConfig = None, turn=None):
+    """ Runs a turn on batches of agents taken from `order` until `estimator.converged`.
+
+    Yields (id, decision, memory_update, status) like iter_turn, for the sampled
+    agents only; the others sit the turn out. Stragglers don't count towards the
+    estimate, since their decision is last turn's.
+
+    The batches make up one turn: `policy.agent_deadline` bounds the whole turn, as it
+    does when every agent runs at once, so each batch only gets the time that's left.
+    """
+    config = config or EstimateConfig.from_env()
+    policy = policy or TurnConfig.from_env()
+    timer = TurnTimer()
+    turn_span = tracing.start_span("turn", agents=len(people), mode="estimate")
+    if turn is not None:
+        turn_span.set(turn=turn)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + policy.agent_deadline if policy.agent_deadline > 0 else None
+    sampled = active = stragglers = 0
+    try:
+        for start in range(0, len(order), config.batch_size):
+            batch_policy = policy
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                batch_policy = replace(policy, agent_deadline=remaining)
+            batch = order[start:start + config.batch_size].tolist()
+            async for i, decision, memory_update, status in iter_turn(
+                    [people[j] for j in batch], mcp_session, ctx, batch_policy, turn=turn,
+                    timer=timer, turn_span=turn_span):
+                if status == STRAGGLER:
+                    stragglers += 1
+                else:
+                    estimator.add(feature_codes[batch[i]], decision)
+                active += status != INACTIVE
+                yield batch[i], decision, memory_update, status
+            sampled += len(batch)
+            estimate = estimator.estimate()
+            metrics.estimate_interval_width.set(estimator.width(estimate, config.scope))
+            if estimator.converged(estimate, config):
+                break
+    finally:
+        metrics.last_turn_sampled_agents.set(sampled)
+        metrics.last_turn_active_agents.set(active)
+        metrics.last_turn_stragglers.set(stragglers)
+        turn_span.set(sampled=sampled, active=active, stragglers=stragglers)
+        timer.finish()
+        turn_span.end()
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """ A unit of background work (an init or a turn) with progress counters.
+
+    Results are appended as they arrive, so clients can fetch them
+    incrementally with an offset while the job is still running.
+    """
+
+    def __init__(self, kind, params=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.status = "queued"
+        self.total = 0
+        self.done = 0
+        self.results = []
+        # For turn jobs, as in RunTurnResponse: agents whose result is a carried-over decision
+        self.stragglers = []
+        self.inactive = []
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "total": self.total,
+            "done": self.done,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    def to_dict(self, offset=0):
+        return {**self.summary(), "offset": offset, "results": self.results[offset:],
+                "stragglers": self.stragglers, "inactive": self.inactive}
+
+
+class JobQueue:
+    """ Runs jobs one at a time, in submission order, on a single background worker.
+
+    Queued turns therefore run back to back without waiting on the client, and
+    a turn queued behind an init always sees the new population.
+    """
+
+    def __init__(self, max_finished=100):
+        self.jobs = {}
+        self.max_finished = max_finished
+        self._queue = asyncio.Queue()
+        self._worker = None
+        self._current = None
+
+    def submit(self, kind, run, params=None):
+        """ Queues `run(job)`, an async function that fills in the job's progress and results. """
+        job = Job(kind, params)
+        self.jobs[job.id] = job
+        self._queue.put_nowait((job, run))
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._work())
+        self._prune()
+        return job
+
+    def cancel(self, job_id):
+        job = self.jobs[job_id]
+        if job.status == "queued":
+            job.status = "cancelled"
+            job.finished_at = time.time()
+        elif job.status == "running" and self._current is not None:
+            self._current.cancel()
+        return job
+
+    async def _work(self):
+        while not self._queue.empty():
+            job, run = self._queue.get_nowait()
+            if job.status == "cancelled":
+                continue
+            job.status = "running"
+            job.started_at = time.time()
+            self._current = asyncio.create_task(run(job))
+            try:
+                await self._current
+                job.status = "done"
+            except asyncio.CancelledError:
+                job.status = "cancelled"
+                # Only the job was cancelled (DELETE /jobs/{id}); if the worker itself was, stop
+                if asyncio.current_task().cancelling():
+                    raise
+            except Exception as e:
+                logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+                job.status = "failed"
+                job.error = getattr(e, "detail", None) or str(e)
+            finally:
+                self._current = None
+                job.finished_at = time.time()
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job.finished_at is not None]
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job.id]
+
+    async def close(self):
+        """ Cancels the running job and everything still queued, and waits for the worker to stop. """
+        while not self._queue.empty():
+            job, _ = self._queue.get_nowait()
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.finished_at = time.time()
+        if self._current is not None:
+            self._current.cancel()
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
@@ -0,0 +1,321 @@
+import asyncio
+import hashlib
+import importlib.util
+import json
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict, deque
+
+import httpx
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient, RateLimitError
+from anthropic.types import Message, TextBlock, ToolUseBlock, Usage
+
+import metrics
+import tracing
+from cassette import CassetteBackend, open_cassette, RECORD, REPLAY
+from config import ConcurrencyConfig, CassetteConfig
+from scheduler import LLMScheduler, DECISION, PRIORITY_NAMES, estimate_tokens
+
+
+class AnthropicBackend:
+    """ Talks to the Anthropic API over one shared keep-alive connection pool. """
+
+    def __init__(self, config: ConcurrencyConfig):
+        http2 = config.http2 and importlib.util.find_spec("h2") is not None
+        self.http_client = DefaultAsyncHttpxClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=config.pool_size,
+                max_keepalive_connections=config.pool_size,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+        )
+        # The scheduler owns retries/backoff, so don't let the SDK retry 429s behind its back
+        self.anthropic = AsyncAnthropic(http_client=self.http_client, max_retries=0)
+
+    async def create(self, **kwargs):
+        return await self.anthropic.messages.create(**kwargs)
+
+    async def aclose(self):
+        await self.anthropic.close()
+
+
+class MockBackend:
+    """ Local stand-in for the Anthropic API, for running without network or API keys.
+
+    Calls offered the make_decision tool pick one of `options` on the first round, then
+    call record_memory if it's offered or answer in text otherwise; calls without tools
+    (memory formation) get a canned memory.
+
+    For load testing, latency can be drawn from a lognormal distribution around
+    `latency` (its median) with spread `latency_sigma`, the first rounds call one of the
+    offered MCP tools with probability `tool_use_prob`, and a `rate_limit_prob` share of
+    calls fail with a 429 carrying `retry_after`.
+
+    Prompt caching is simulated like the API does it: the prefix (tools, system,
+    messages) up to each cache_control breakpoint is cached for `cache_ttl` seconds,
+    and usage reports cache reads and writes separately from uncached input tokens.
+    """
+
+    def __init__(self, options=None, latency=0.0, seed=None, latency_sigma=0.0, tool_use_prob=0.0,
+                 rate_limit_prob=0.0, retry_after=1.0, cache_ttl=300.0):
+        self.options = options or ["Undecided"]
+        self.cache_ttl = cache_ttl
+        self.prompt_cache = OrderedDict()  # prefix hash -> expiry
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.tool_use_prob = tool_use_prob
+        self.rate_limit_prob = rate_limit_prob
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+
+    def _rate_limit_error(self):
+        request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+        response = httpx.Response(429, request=request, headers={"retry-after": str(self.retry_after)})
+        return RateLimitError("Mock rate limit", response=response, body=None)
+
+    @staticmethod
+    def _fake_input(tool):
+        schema = tool.get("input_schema") or {}
+        properties = schema.get("properties", {})
+        fake = {"string": "NYC mayoral election", "integer": 3, "number": 1.0, "boolean": True}
+        return {name: fake.get(properties.get(name, {}).get("type")) for name in schema.get("required", [])}
+
+    def _prompt_usage(self, kwargs):
+        """ Returns (uncached, cache_read, cache_creation) input tokens for a request. """
+        parts = [*(kwargs.get("tools") or [])]
+        system = kwargs.get("system")
+        parts.extend(system if isinstance(system, list) else [system] if system else [])
+        for message in kwargs.get("messages", []):
+            content = message["content"]
+            parts.extend(content if isinstance(content, list) else [content])
+
+        prefix = hashlib.sha256()
+        total = 0
+        breakpoints = []
+        for part in parts:
+            encoded = json.dumps(part, sort_keys=True, default=str)
+            prefix.update(encoded.encode())
+            total += estimate_tokens(encoded)
+            if isinstance(part, dict) and part.get("cache_control"):
+                breakpoints.append((prefix.hexdigest(), total))
+
+        now = time.monotonic()
+        cache_read = 0
+        for digest, tokens in breakpoints:
+            if self.prompt_cache.get(digest, 0) > now:
+                cache_read = tokens
+        cache_creation = breakpoints[-1][1] - cache_read if breakpoints else 0
+        for digest, _ in breakpoints:
+            self.prompt_cache[digest] = now + self.cache_ttl
+            self.prompt_cache.move_to_end(digest)
+        while len(self.prompt_cache) > 100_000:
+            self.prompt_cache.popitem(last=False)
+        return total - cache_read - cache_creation, cache_read, cache_creation
+
+    def _tool_use(self, name, input):
+        return ToolUseBlock(type="tool_use", id=f"toolu_{uuid.uuid4().hex[:24]}", name=name, input=input)
+
+    async def create(self, **kwargs):
+        if self.latency:
+            delay = self.latency
+            if self.latency_sigma:
+                delay *= self.rng.lognormvariate(0.0, self.latency_sigma)
+            await asyncio.sleep(delay)
+        if self.rate_limit_prob and self.rng.random() < self.rate_limit_prob:
+            raise self._rate_limit_error()
+        input_tokens, cache_read, cache_creation = self._prompt_usage(kwargs)
+        messages = kwargs.get("messages", [])
+        tools = kwargs.get("tools") or []
+        # Tool calls made so far in this conversation (blocks are SDK objects or dicts)
+        called = [
+            block["name"] if isinstance(block, dict) else block.name
+            for m in messages if isinstance(m["content"], list)
+            for block in m["content"]
+            if (block.get("type") if isinstance(block, dict) else getattr(block, "type", None)) == "tool_use"
+        ]
+        mcp_tools = [t for t in tools if t["name"] not in ("make_decision", "record_memory")]
+        if mcp_tools and len(called) < 2 and self.rng.random() < self.tool_use_prob:
+            tool = self.rng.choice(mcp_tools)
+            content = [self._tool_use(tool["name"], self._fake_input(tool))]
+            stop_reason = "tool_use"
+        elif any(t["name"] == "make_decision" for t in tools) and "make_decision" not in called:
+            content = [self._tool_use("make_decision", {"decision": self.rng.choice(self.options)})]
+            stop_reason = "tool_use"
+        elif any(t["name"] == "record_memory" for t in tools):
+            content = [self._tool_use("record_memory", {"memory": "I checked the news today and settled on my current choice."})]
+            stop_reason = "tool_use"
+        else:
+            text = "I reviewed today's context and kept my current view." if tools else \
+                "I checked the news today and settled on my current choice."
+            content = [TextBlock(type="text", text=text)]
+            stop_reason = "end_turn"
+        return Message(
+            id=f"msg_{uuid.uuid4().hex[:24]}",
+            type="message",
+            role="assistant",
+            model=kwargs.get("model", "mock"),
+            content=content,
+            stop_reason=stop_reason,
+            usage=Usage(
+                input_tokens=input_tokens,
+                output_tokens=sum(estimate_tokens(block.model_dump()) for block in content),
+                cache_read_input_tokens=cache_read,
+                cache_creation_input_tokens=cache_creation,
+            ),
+        )
+
+    async def aclose(self):
+        pass
+
+
+class LatencyTracker:
+    """ Recent latencies of successful calls, for picking the hedging delay. """
+
+    def __init__(self, percentile, min_samples=100, window=1000):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.samples = deque(maxlen=window)
+        self._threshold = None
+        self._stale = 0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self._stale += 1
+
+    def threshold(self):
+        """ The latency percentile, or None until there are enough samples. """
+        if len(self.samples) < self.min_samples:
+            return None
+        # Re-sorting on every call would be wasteful at thousands of calls per turn
+        if self._threshold is None or self._stale >= 50:
+            ordered = sorted(self.samples)
+            self._threshold = ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+            self._stale = 0
+        return self._threshold
+
+
+class LLMClient:
+    """ Process-wide entry point for model calls: a backend behind the shared scheduler.
+
+    With `hedge_percentile` set, a decision call still running past that percentile
+    of recent decision latencies is sent a second time, if the scheduler has room,
+    and whichever response arrives first is used.
+    """
+
+    def __init__(self, backend, scheduler: LLMScheduler = None, hedge_percentile=0.0, hedge_min_samples=100):
+        self.backend = backend
+        self.scheduler = scheduler
+        self.latencies = LatencyTracker(hedge_percentile, hedge_min_samples) if hedge_percentile else None
+
+    async def _send(self, priority, kwargs):
+        if self.scheduler is None:
+            return await self.backend.create(**kwargs)
+        tokens = estimate_tokens(kwargs.get("system"), kwargs.get("messages"), kwargs.get("tools"))
+        return await self.scheduler.submit(lambda: self.backend.create(**kwargs), priority, tokens)
+
+    def _can_hedge(self):
+        return self.scheduler is None or self.scheduler.in_flight < self.scheduler.limit
+
+    async def _send_hedged(self, priority, kwargs, delay, kind):
+        tasks = {asyncio.ensure_future(self._send(priority, kwargs))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self._can_hedge():
+                metrics.llm_hedged_total.inc(kind=kind)
+                tracing.current_span().set(hedged=True)
+                tasks.add(asyncio.ensure_future(self._send(priority, kwargs)))
+            while True:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                if not tasks:
+                    return done.pop().result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def create(self, priority=DECISION, **kwargs):
+        """ Sends a messages.create request, admitted through the scheduler if one is set. """
+        kind = PRIORITY_NAMES.get(priority, str(priority))
+        start = time.perf_counter()
+        with tracing.span("llm", kind=kind, model=kwargs.get("model")) as span:
+            try:
+                delay = self.latencies.threshold() if self.latencies and priority == DECISION else None
+                if delay is None:
+                    response = await self._send(priority, kwargs)
+                else:
+                    response = await self._send_hedged(priority, kwargs, delay, kind)
+            except Exception:
+                metrics.llm_errors_total.inc(kind=kind)
+                raise
+            elapsed = time.perf_counter() - start
+            metrics.llm_request_seconds.observe(elapsed, kind=kind)
+            if self.latencies and priority == DECISION:
+                self.latencies.add(elapsed)
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                input_tokens = getattr(usage, "input_tokens", 0) or 0
+                output_tokens = getattr(usage, "output_tokens", 0) or 0
+                cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+                cache_creation = getattr(usage, "cache_creation_input_tokens", 0) or 0
+                metrics.llm_input_tokens_total.inc(input_tokens, kind=kind)
+                metrics.llm_output_tokens_total.inc(output_tokens, kind=kind)
+                metrics.llm_cache_read_tokens_total.inc(cache_read, kind=kind)
+                metrics.llm_cache_creation_tokens_total.inc(cache_creation, kind=kind)
+                metrics.llm_cache_requests_total.inc(kind=kind, result="hit" if cache_read else "miss")
+                span.set(input_tokens=input_tokens, output_tokens=output_tokens,
+                         cache_read_input_tokens=cache_read, cache_creation_input_tokens=cache_creation)
+        return response
+
+    async def aclose(self):
+        await self.backend.aclose()
+
+
+def make_backend(config: ConcurrencyConfig, cassette: CassetteConfig = None):
+    """ Picks the backend named by LLM_BACKEND ("anthropic" by default, or "mock"),
+    wrapped for recording or replaced by the recordings as CASSETTE_MODE says. """
+    cassette = cassette or CassetteConfig.from_env()
+    if cassette.mode == REPLAY:
+        return CassetteBackend(None, open_cassette(cassette.path), REPLAY)
+    name = os.environ.get("LLM_BACKEND", "anthropic")
+    if name == "mock":
+        backend = MockBackend(
+            latency=float(os.environ.get("LLM_MOCK_LATENCY", "0")),
+            latency_sigma=float(os.environ.get("LLM_MOCK_LATENCY_SIGMA", "0")),
+            tool_use_prob=float(os.environ.get("LLM_MOCK_TOOL_PROB", "0")),
+            rate_limit_prob=float(os.environ.get("LLM_MOCK_429_RATE", "0")),
+            retry_after=float(os.environ.get("LLM_MOCK_RETRY_AFTER", "1")),
+        )
+    elif name == "anthropic":
+        backend = AnthropicBackend(config)
+    else:
+        raise ValueError(f"Unknown LLM_BACKEND: {name}")
+    if cassette.mode == RECORD:
+        return CassetteBackend(backend, open_cassette(cassette.path), RECORD)
+    return backend
+
+
+_default_client = None
+
+
+def get_llm() -> LLMClient:
+    """ Returns the shared client, building it from the environment on first use. """
+    global _default_client
+    if _default_client is None:
+        config = ConcurrencyConfig.from_env()
+        cassette = CassetteConfig.from_env()
+        # Replayed calls cost nothing, so don't hold them to the provider's rate limits
+        scheduler = None if cassette.mode == REPLAY else LLMScheduler(config)
+        _default_client = LLMClient(make_backend(config, cassette), scheduler,
+                                    config.hedge_percentile, config.hedge_min_samples)
+    return _default_client
+
+
+def set_llm(client: LLMClient):
+    """ Replaces the shared client, e.g. to inject a mock backend or custom limits. """
+    global _default_client
+    _default_client = client
@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import json
+import logging
+
+from mcp import ClientSession, types
+
+logger = logging.getLogger(__name__)
+
+# Resources whose content doesn't change between reads. resource://next_timestep
+# advances the simulation on every read, so it must never be cached.
+STATIC_RESOURCES = ("resource://init",)
+
+
+def _content_hash(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _resolved(value):
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(value)
+    return future
+
+
+class MCPCache:
+    """ Wraps an MCP session and caches its static data: the tool list, prompts and
+    static resources. Every agent shares one cache, so a turn costs one list_tools
+    and an init costs one get_prompt per distinct feature, however many agents run.
+
+    Entries are dropped when the server sends a list-changed/resource-updated
+    notification (pass `handle_message` as the ClientSession's message_handler),
+    or when `refresh()` sees that the tool list or init payload hash has changed.
+    Anything that isn't cached (call_tool, ...) is forwarded to the session.
+    """
+
+    def __init__(self, session: ClientSession = None, static_resources=STATIC_RESOURCES):
+        self.session = session
+        self.static_resources = set(static_resources)
+        self.tools_hash = None
+        self.init_hash = None
+        self._tools = {}
+        self._tool_schemas = None
+        self._prompts = {}
+        self._resources = {}
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    async def handle_message(self, message):
+        """ ClientSession message_handler that invalidates entries on server notifications. """
+        if not isinstance(message, types.ServerNotification):
+            return
+        notification = message.root
+        if isinstance(notification, types.ToolListChangedNotification):
+            self.invalidate_tools()
+        elif isinstance(notification, types.PromptListChangedNotification):
+            self._prompts.clear()
+        elif isinstance(notification, types.ResourceListChangedNotification):
+            self._resources.clear()
+        elif isinstance(notification, types.ResourceUpdatedNotification):
+            self._resources.pop(str(notification.params.uri), None)
+
+    def invalidate_tools(self):
+        self._tools.clear()
+        self._tool_schemas = None
+        self.tools_hash = None
+
+    def invalidate(self):
+        self.invalidate_tools()
+        self._prompts.clear()
+        self._resources.clear()
+
+    async def _cached(self, store, key, fetch):
+        # Store the task, not the result, so concurrent misses share a single request
+        task = store.get(key)
+        if task is None:
+            task = store[key] = asyncio.ensure_future(fetch())
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            if store.get(key) is task:
+                del store[key]
+            raise
+
+    async def list_tools(self):
+        response = await self._cached(self._tools, "tools", self.session.list_tools)
+        if self.tools_hash is None:
+            self.tools_hash = _content_hash([t.model_dump() for t in response.tools])
+        return response
+
+    async def tool_schemas(self):
+        """ The server's tools in Anthropic tool format, built once per tool list. """
+        if self._tool_schemas is None:
+            response = await self.list_tools()
+            self._tool_schemas = [
+                {
+                    "name": tool.name,
+                    "description": tool.description,
+                    "input_schema": tool.inputSchema
+                }
+                for tool in response.tools
+            ]
+        return self._tool_schemas
+
+    async def get_prompt(self, name, arguments=None):
+        if arguments:
+            return await self.session.get_prompt(name, arguments)
+        return await self._cached(self._prompts, name, lambda: self.session.get_prompt(name))
+
+    async def read_resource(self, uri, retry=True):
+        """ Reads a resource, from the cache if it's static. Pass retry=False for resources
+        that change server state when read, like resource://next_timestep advancing the clock. """
+        uri = str(uri)
+        if not retry:
+            return await self.session.read_resource(uri, retry=False)
+        if uri not in self.static_resources:
+            return await self.session.read_resource(uri)
+        return await self._cached(self._resources, uri, lambda: self.session.read_resource(uri))
+
+    async def refresh(self):
+        """ Revalidates the cache against the server with O(1) requests; call once per turn.
+
+        Re-fetches the tool list and static resources and drops whatever changed.
+        A changed init payload also drops the prompts, since features come from it.
+        """
+        tools = await self.session.list_tools()
+        tools_hash = _content_hash([t.model_dump() for t in tools.tools])
+        if tools_hash != self.tools_hash:
+            if self.tools_hash is not None:
+                logger.info("MCP tool list changed, rebuilding tool schemas")
+            self.invalidate_tools()
+            self._tools["tools"] = _resolved(tools)
+            self.tools_hash = tools_hash
+
+        for uri in self.static_resources:
+            resource = await self.session.read_resource(uri)
+            self._resources[uri] = _resolved(resource)
+            if uri == "resource://init":
+                init_hash = _content_hash([c.model_dump() for c in resource.contents])
+                if self.init_hash is not None and init_hash != self.init_hash:
+                    logger.info("MCP init payload changed, dropping cached prompts")
+                    self._prompts.clear()
+                self.init_hash = init_hash
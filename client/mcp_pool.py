@@ -0,0 +1,170 @@
+import asyncio
+import logging
+from contextlib import AsyncExitStack
+from datetime import timedelta
+
+from mcp import ClientSession
+from mcp.shared.exceptions import McpError
+
+logger = logging.getLogger(__name__)
+
+REQUEST_TIMEOUT = 408
+
+
+class _Member:
+    def __init__(self, index):
+        self.index = index
+        self.session = None
+        self.in_flight = 0
+        self.ready = asyncio.Event()
+        self.restart = asyncio.Event()
+        self.task = None
+
+
+def _is_connection_error(e):
+    # McpErrors are answers from the server (bad tool args, ...), except timeouts,
+    # which are what a silently dropped stream looks like from this side.
+    if isinstance(e, McpError):
+        return e.error.code == REQUEST_TIMEOUT
+    return True
+
+
+class MCPSessionPool:
+    """ A pool of MCP sessions to the same server, with the ClientSession methods
+    the agents use (call_tool, list_tools, get_prompt, read_resource).
+
+    Each request goes to the healthy session with the fewest requests in flight.
+    Sessions are pinged every `health_interval` seconds. A session that fails or
+    times out is reconnected in the background, with backoff, and the request
+    that hit it is retried on another session, so a single dropped stream
+    doesn't fail the turn.
+
+    Args:
+        connect: zero-argument callable returning an async context manager that yields
+            (read_stream, write_stream, ...), e.g. `lambda: sse_client(url)`.
+        size: number of sessions.
+        message_handler: passed to every ClientSession (e.g. MCPCache.handle_message).
+    """
+
+    def __init__(self, connect, size=4, message_handler=None, request_timeout=120.0,
+                 health_interval=15.0, max_attempts=3):
+        self.connect = connect
+        self.size = size
+        self.message_handler = message_handler
+        self.request_timeout = request_timeout
+        self.health_interval = health_interval
+        self.max_attempts = max_attempts
+        self.members = [_Member(i) for i in range(size)]
+        self._closing = False
+        self._health_task = None
+
+    async def start(self, timeout=30.0):
+        """ Opens every session; returns once at least one is ready. """
+        for member in self.members:
+            member.task = asyncio.create_task(self._run_member(member))
+        self._health_task = asyncio.create_task(self._health_loop())
+        await self._wait_ready(timeout)
+        logger.info(f"MCP session pool started ({sum(m.session is not None for m in self.members)}/{self.size} ready)")
+
+    async def close(self):
+        self._closing = True
+        if self._health_task is not None:
+            self._health_task.cancel()
+        for member in self.members:
+            member.restart.set()
+        await asyncio.gather(*(m.task for m in self.members if m.task is not None), return_exceptions=True)
+
+    async def _run_member(self, member):
+        # The transport and session are opened and closed inside this one task,
+        # since their anyio task groups must be exited by the task that entered them.
+        delay = 1.0
+        while not self._closing:
+            try:
+                async with AsyncExitStack() as stack:
+                    streams = await stack.enter_async_context(self.connect())
+                    session = await stack.enter_async_context(ClientSession(
+                        streams[0], streams[1],
+                        read_timeout_seconds=timedelta(seconds=self.request_timeout),
+                        message_handler=self.message_handler,
+                    ))
+                    await session.initialize()
+                    member.session = session
+                    member.ready.set()
+                    delay = 1.0
+                    await member.restart.wait()
+            except Exception as e:
+                logger.warning(f"MCP session {member.index} failed: {e!r}")
+            member.session = None
+            member.ready.clear()
+            member.restart.clear()
+            if not self._closing:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for member in self.members:
+                if member.session is None:
+                    continue
+                try:
+                    await asyncio.wait_for(member.session.send_ping(), timeout=self.health_interval)
+                except Exception as e:
+                    logger.warning(f"MCP session {member.index} failed health check: {e!r}")
+                    self._mark_failed(member)
+
+    def _mark_failed(self, member):
+        # Stop dispatching to it right away; its task reconnects in the background
+        member.session = None
+        member.ready.clear()
+        member.restart.set()
+
+    async def _wait_ready(self, timeout):
+        if any(m.session is not None for m in self.members):
+            return
+        waiters = [asyncio.create_task(m.ready.wait()) for m in self.members]
+        try:
+            done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        if not done:
+            raise ConnectionError(f"No MCP session became ready within {timeout}s")
+
+    async def _call(self, method, *args, retry=True, **kwargs):
+        """ Sends a request to the least busy session. With `retry`, a request whose session
+        failed is sent again on another one; pass retry=False for requests with side effects,
+        which may have reached the server even though the response was lost. """
+        attempts = self.max_attempts if retry else 1
+        for attempt in range(attempts):
+            await self._wait_ready(self.request_timeout)
+            member = min((m for m in self.members if m.session is not None), key=lambda m: m.in_flight)
+            session = member.session
+            member.in_flight += 1
+            try:
+                return await getattr(session, method)(*args, **kwargs)
+            except Exception as e:
+                if not _is_connection_error(e):
+                    raise
+                if member.session is session:
+                    self._mark_failed(member)
+                if attempt == attempts - 1:
+                    raise
+                logger.warning(f"MCP session {member.index} failed during {method}, retrying: {e!r}")
+            finally:
+                member.in_flight -= 1
+
+    async def call_tool(self, name, arguments=None):
+        return await self._call("call_tool", name, arguments)
+
+    async def list_tools(self):
+        return await self._call("list_tools")
+
+    async def get_prompt(self, name, arguments=None):
+        return await self._call("get_prompt", name, arguments)
+
+    async def read_resource(self, uri, retry=True):
+        return await self._call("read_resource", uri, retry=retry)
+
+    async def send_ping(self):
+        return await self._call("send_ping")
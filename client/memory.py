@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+
+from base_prompts import summary_prompt
+from llm import LLMClient
+from scheduler import COMPACTION
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("MEMORY_TOKEN_BUDGET", "1500"))
+
+
+def count_tokens(text):
+    return len(text) // 4 + 1
+
+
+class MemoryStore:
+    """ An agent's memories, kept under a token budget.
+
+    New memories are stored verbatim. Once the rendered memory exceeds
+    `token_budget`, the oldest `chunk_size` entries are folded into a level-1
+    summary, and every `fanout` summaries of one level are folded into a single
+    summary of the next level. Older history therefore takes up less and less
+    room, and the prompt stays bounded however many turns are simulated.
+
+    With `background=True` compaction runs as a task after `add()` and the next
+    prompt uses whatever has been folded so far; otherwise call `compact()`.
+    """
+
+    def __init__(self, llm: LLMClient, model, token_budget=DEFAULT_TOKEN_BUDGET,
+                 chunk_size=4, fanout=4, keep_recent=2, background=True):
+        self.llm = llm
+        self.model = model
+        self.token_budget = token_budget
+        self.chunk_size = chunk_size
+        self.fanout = fanout
+        self.keep_recent = keep_recent
+        self.background = background
+        self.summaries = []  # (level, text), oldest first
+        self.entries = []    # verbatim memories, oldest first
+        self._task = None
+
+    def __str__(self):
+        return "".join("\n\n" + text for _, text in self.summaries) + "".join("\n\n" + text for text in self.entries)
+
+    def tokens(self):
+        return count_tokens(str(self))
+
+    def to_state(self):
+        return {"summaries": self.summaries, "entries": self.entries}
+
+    def load_state(self, state):
+        """ Replaces the memories, cancelling a background compaction still working on the old ones. """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.summaries = [(level, text) for level, text in state["summaries"]]
+        self.entries = list(state["entries"])
+
+    def add(self, text):
+        self.entries.append(text)
+        if self.background and self.tokens() > self.token_budget and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self.compact())
+
+    async def wait(self):
+        """ Waits for a running background compaction to finish. """
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def compact(self):
+        """ Folds the oldest memories into summaries until the store fits its budget. """
+        try:
+            while self.tokens() > self.token_budget:
+                if len(self.entries) > self.keep_recent:
+                    n = min(self.chunk_size, len(self.entries) - self.keep_recent)
+                    summary = await self._summarize(self.entries[:n])
+                    # Entries are only ever appended meanwhile, so the first n are the ones summarized
+                    del self.entries[:n]
+                    self._insert_summary(1, summary)
+                elif len(self.summaries) > 1:
+                    # Only summaries left to shrink: merge the two oldest into a higher level
+                    (l1, t1), (l2, t2) = self.summaries[:2]
+                    summary = await self._summarize([t1, t2])
+                    self.summaries[:2] = [(max(l1, l2) + 1, summary)]
+                else:
+                    break
+                await self._cascade()
+        except Exception as e:
+            logger.error(f"Memory compaction failed: {e}")
+
+    def _insert_summary(self, level, text):
+        # Summaries are ordered oldest first, which is also highest level first
+        i = len(self.summaries)
+        while i > 0 and self.summaries[i - 1][0] < level:
+            i -= 1
+        self.summaries.insert(i, (level, text))
+
+    async def _cascade(self):
+        level = 1
+        while True:
+            indices = [i for i, (l, _) in enumerate(self.summaries) if l == level]
+            if len(indices) < self.fanout:
+                if not any(l > level for l, _ in self.summaries):
+                    return
+                level += 1
+                continue
+            group = indices[:self.fanout]
+            summary = await self._summarize([self.summaries[i][1] for i in group])
+            for i in reversed(group):
+                del self.summaries[i]
+            self._insert_summary(level + 1, summary)
+
+    async def _summarize(self, texts):
+        max_words = max(50, self.token_budget // 8)
+        response = await self.llm.create(
+            COMPACTION,
+            model=self.model,
+            max_tokens=1024,
+            messages=[
+                {
+                    "role": "user",
+                    "content": summary_prompt.format(memories="\n\n".join(texts), max_words=max_words)
+                }
+            ],
+            temperature=0.3
+        )
+        return response.content[0].text
@@ -0,0 +1,215 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Minimal Prometheus-style metrics, exposed in the text exposition format at /metrics.
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 60.0, 120.0, 300.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def total(self):
+        """ Sum over all label values. """
+        return sum(self._values.values())
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._function = None
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def set_function(self, fn):
+        """ Reads the (unlabelled) value from `fn()` at scrape time. """
+        self._function = fn
+
+    def _samples(self):
+        if self._function is not None:
+            return [f"{self.name} {self._function()}"]
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self):
+        """ Observations over all label values. """
+        return sum(state[-1] for state in self._values.values())
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        lines = []
+        for key, state in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+REGISTRY = []
+
+
+def render():
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# LLM calls (kind is the scheduler priority: decision, memory or compaction)
+llm_request_seconds = Histogram("llm_request_seconds", "Latency of LLM requests, including queueing", ["kind"])
+llm_queue_seconds = Histogram("llm_queue_seconds", "Time LLM requests waited for admission by the scheduler", ["kind"])
+llm_in_flight = Gauge("llm_in_flight", "LLM requests currently in flight")
+llm_queued = Gauge("llm_queued", "LLM requests waiting for admission")
+llm_concurrency_limit = Gauge("llm_concurrency_limit", "Current adaptive in-flight limit of the scheduler")
+llm_rate_limited_total = Counter("llm_rate_limited_total", "429/529 responses from the LLM provider", ["status"])
+llm_retries_total = Counter("llm_retries_total", "LLM requests retried after a rate limit")
+llm_errors_total = Counter("llm_errors_total", "LLM requests that failed", ["kind"])
+llm_input_tokens_total = Counter("llm_input_tokens_total", "Input tokens sent to the LLM provider", ["kind"])
+llm_output_tokens_total = Counter("llm_output_tokens_total", "Output tokens received from the LLM provider", ["kind"])
+llm_cache_read_tokens_total = Counter("llm_cache_read_tokens_total", "Input tokens served from the provider's prompt cache", ["kind"])
+llm_cache_creation_tokens_total = Counter("llm_cache_creation_tokens_total", "Input tokens written to the provider's prompt cache", ["kind"])
+llm_cache_requests_total = Counter("llm_cache_requests_total", "LLM requests by whether they read from the prompt cache", ["kind", "result"])
+
+# MCP tool calls and memory formation
+mcp_tool_call_seconds = Histogram("mcp_tool_call_seconds", "Latency of MCP tool calls", ["tool"])
+mcp_tool_errors_total = Counter("mcp_tool_errors_total", "MCP tool calls that failed", ["tool"])
+mcp_in_flight = Gauge("mcp_in_flight", "MCP tool calls currently in flight")
+memory_update_seconds = Histogram("memory_update_seconds", "Latency of memory formation calls")
+
+# Turns
+turn_seconds = Histogram("turn_seconds", "Wall time of whole turns", buckets=LATENCY_BUCKETS + (600.0, 1200.0, 3600.0))
+agent_turn_seconds = Histogram("agent_turn_seconds", "Wall time of single agent-turns")
+last_turn_seconds = Gauge("last_turn_seconds", "Wall time of the last turn")
+last_turn_agent_seconds = Gauge("last_turn_agent_seconds", "Agent-turn wall time percentiles in the last turn (stragglers)", ["quantile"])
+last_turn_input_tokens = Gauge("last_turn_input_tokens", "Input tokens used by the last turn")
+last_turn_output_tokens = Gauge("last_turn_output_tokens", "Output tokens used by the last turn")
+last_turn_cache_read_tokens = Gauge("last_turn_cache_read_tokens", "Prompt-cache read tokens in the last turn")
+last_turn_cache_creation_tokens = Gauge("last_turn_cache_creation_tokens", "Prompt-cache write tokens in the last turn")
+turns_total = Counter("turns_total", "Turns completed")
+turn_stragglers_total = Counter("turn_stragglers_total", "Agent-turns cut off by a deadline, an error or the quorum")
+last_turn_stragglers = Gauge("last_turn_stragglers", "Agents cut off in the last turn")
+last_turn_active_agents = Gauge("last_turn_active_agents", "Agents the activation policy ran in the last turn")
+activations_total = Counter("activations_total", "Agent-turns run, by why the activation policy picked them", ["reason"])
+archetype_copies_total = Counter("archetype_copies_total", "Agent-turns that copied an identical agent's run instead of calling the LLM")
+last_turn_sampled_agents = Gauge("last_turn_sampled_agents", "Agents launched by the last estimation turn")
+estimate_interval_width = Gauge("estimate_interval_width", "Widest vote-share confidence interval of the running estimate")
+llm_hedged_total = Counter("llm_hedged_total", "Hedged LLM requests sent after the first was slow", ["kind"])
+
+
+class TurnTimer:
+    """ Records a turn's wall time, its agent-turn percentiles and the tokens it used. """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.input_tokens = llm_input_tokens_total.total()
+        self.output_tokens = llm_output_tokens_total.total()
+        self.cache_read_tokens = llm_cache_read_tokens_total.total()
+        self.cache_creation_tokens = llm_cache_creation_tokens_total.total()
+        self.agent_seconds = []
+
+    def agent_done(self, seconds):
+        self.agent_seconds.append(seconds)
+        agent_turn_seconds.observe(seconds)
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.start
+        turn_seconds.observe(elapsed)
+        last_turn_seconds.set(elapsed)
+        turns_total.inc()
+        last_turn_input_tokens.set(llm_input_tokens_total.total() - self.input_tokens)
+        last_turn_output_tokens.set(llm_output_tokens_total.total() - self.output_tokens)
+        last_turn_cache_read_tokens.set(llm_cache_read_tokens_total.total() - self.cache_read_tokens)
+        last_turn_cache_creation_tokens.set(llm_cache_creation_tokens_total.total() - self.cache_creation_tokens)
+        if self.agent_seconds:
+            ordered = sorted(self.agent_seconds)
+            for q in (0.5, 0.9, 0.95, 0.99):
+                last_turn_agent_seconds.set(ordered[min(len(ordered) - 1, int(q * len(ordered)))], quantile=q)
+            last_turn_agent_seconds.set(ordered[-1], quantile="max")
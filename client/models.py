@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+from typing import List, Tuple, Dict, Any, Optional
+
+
+class InitRequest(BaseModel):
+    num_people: int
+    seed: Optional[int] = None
+
+class InitResponse(BaseModel):
+    people: List[Tuple[int, List[str]]]
+
+class RunTurnResponse(BaseModel):
+    updates: List[Tuple[int, Dict[str, Any], str]]
+    stragglers: List[int] = []  # agents cut off this turn; their update carries the previous decision
+    inactive: List[int] = []  # agents the activation policy skipped; their update carries their current decision
+
+class EstimateTurnResponse(RunTurnResponse):
+    sampled: int  # agents launched this turn; the rest sat it out
+    converged: bool  # whether the intervals reached the target width before the population ran out
+    estimate: Dict[str, Any]  # vote-share intervals, overall and by demographic feature
+
+class CheckpointRequest(BaseModel):
+    path: Optional[str] = None
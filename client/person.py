@@ -1,10 +1,16 @@
+import asyncio
 import uuid
 import numpy as np
 import logging
-from anthropic import AsyncAnthropic
 from dotenv import load_dotenv
-from base_prompts import memory_prompt
-from mcp import ClientSession
+import os
+from base_prompts import memory_prompt, record_memory_instruction
+from mcp_cache import MCPCache
+from scheduler import DECISION, MEMORY
+from llm import LLMClient, get_llm
+from memory import MemoryStore, DEFAULT_TOKEN_BUDGET
+import metrics
+import tracing
 
 load_dotenv()
 
@@ -14,84 +20,123 @@ logger = logging.getLogger(__name__)
 
 # TODO should be accessing resources?
 
+MAKE_DECISION_TOOL = {
+    "name": "make_decision", 
+    "description": "Make or change your decision based on the available options.", 
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "decision": {"type": "string"}
+        },
+        "required": ["decision"]
+    }
+}
+
+RECORD_MEMORY_TOOL = {
+    "name": "record_memory",
+    "description": "Record your memory of today. This ends your turn.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "memory": {"type": "string"}
+        },
+        "required": ["memory"]
+    }
+}
+
+# Provider prompt-cache breakpoint: the request prefix up to a block marked with it is cached
+# (the API skips prefixes shorter than the model's minimum, 1024-2048 tokens)
+CACHE_BREAKPOINT = {"type": "ephemeral"}
+
+# "separate": a second model call turns the conversation into a memory (the original behaviour).
+# "fused": the decision loop ends with a record_memory tool call, saving that round-trip.
+DEFAULT_MEMORY_MODE = os.environ.get("MEMORY_MODE", "separate")
+
+def assemble_sys_prompt(base_prompt, features, feature_prompts):
+    """ Builds a system prompt from the scenario context and the text of each feature's prompt. """
+    prompt = base_prompt
+    for f in features:
+        prompt += feature_prompts[f]
+        prompt += "\n"
+    return prompt
+
+
 class PersonV2:
-    def __init__(self, features, model="claude-3-5-haiku-latest", memory_model = "claude-3-5-haiku-latest", temp=0.7, max_tokens=2048):
+    def __init__(self, features, model="claude-3-5-haiku-latest", memory_model = "claude-3-5-haiku-latest", temp=0.7, max_tokens=2048, llm: LLMClient = None,
+                 memory_token_budget=DEFAULT_TOKEN_BUDGET, memory_mode=DEFAULT_MEMORY_MODE):
         self.features = features
         self.model = model
         self.memory_model = memory_model
         self.temp = temp
         self.max_tokens = max_tokens
-        self.anthropic = AsyncAnthropic()
+        self.llm = llm or get_llm()
         self.decision = "Undecided"
         self.sys_prompt = ""
-        self.memory = ""  # Initialize memory as empty string
+        self.memory = MemoryStore(self.llm, memory_model, memory_token_budget)
+        self.memory_mode = memory_mode
         self.options = []
         self.id = uuid.uuid4()  # Add id for consistency with Person class
+        # Activation state (see activation.py): last turn this agent ran, and how many
+        # of its runs in a row left its decision unchanged
+        self.last_active = None
+        self.unchanged = 0
 
-    async def generate_sys_prompt(self, base_prompt, mcp_session: ClientSession, options):
+    async def generate_sys_prompt(self, base_prompt, mcp_session: MCPCache, options):
         self.options = options
-        prompt = base_prompt
-        base_prompt += f"\n You have the following options: {options}"
+        feature_prompts = {}
         for f in self.features:
             feature_prompt = await mcp_session.get_prompt(f)
-            prompt += str(feature_prompt.messages[0].content.text)
-            prompt += "\n"
+            feature_prompts[f] = str(feature_prompt.messages[0].content.text)
 
-        self.sys_prompt = prompt 
+        self.sys_prompt = assemble_sys_prompt(base_prompt, self.features, feature_prompts)
 
-    async def call_llm(self, mcp_session: ClientSession, ctx):
+    async def call_llm(self, mcp_session: MCPCache, ctx):
         """ Makes an LLM call with the mcp server and context.
             Loops until there are no more tool calls, then updates memory.
+            In "fused" memory mode the memory comes from the loop's final record_memory
+            call instead, and update() only runs if the model never made that call.
         """
 
-        # Convert ctx to string if it's a list
-        ctx_str = ctx if isinstance(ctx, str) else str(ctx)
-        
-        prompt = self.sys_prompt + "\n\n Here's all the memories you've retained up to this point. \n\n" + self.memory+ "\n\n Here's some updated context \n\n" + ctx_str
-        print("here")
+        with tracing.span("prompt"):
+            # Convert ctx to string if it's a list
+            ctx_str = ctx if isinstance(ctx, str) else str(ctx)
+            
+            # Stable prefix (tools, then the scenario and demographic text in feature order) is
+            # cached by the provider and shared by every agent with the same features; the
+            # volatile memory and day's context go last, in the user message.
+            fused = self.memory_mode == "fused"
+            system = self.sys_prompt + record_memory_instruction if fused else self.sys_prompt
+            prompt = "Here's all the memories you've retained up to this point. \n\n" + str(self.memory) + "\n\n Here's some updated context \n\n" + ctx_str
         messages = [{
             "role": "user", # TODO should we be using user here?
-            "content": prompt
+            # Cached too, so later rounds of this agent's loop only pay for the new turns
+            "content": [{"type": "text", "text": prompt, "cache_control": CACHE_BREAKPOINT}]
         }]
 
-        # Get available tools
-        tools_response = await mcp_session.list_tools()
-        available_tools = []
-        
-        for tool in tools_response.tools:
-            tool_schema = {
-                "name": tool.name,
-                "description": tool.description,
-                "input_schema": tool.inputSchema
-            }
-            available_tools.append(tool_schema)
-
-        available_tools.append({
-            "name": "make_decision", 
-            "description": "Make or change your decision based on the available options.", 
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "decision": {"type": "string"}
-                },
-                "required": ["decision"]
-            }
-        })
-        # Track the full conversation history
-        conversation_history = messages.copy()
+        # Get available tools (cached once per tool list, shared by every agent)
+        with tracing.span("list_tools"):
+            available_tools = [*await mcp_session.tool_schemas(), MAKE_DECISION_TOOL]
+        if fused:
+            available_tools.append(RECORD_MEMORY_TOOL)
+        available_tools[-1] = {**available_tools[-1], "cache_control": CACHE_BREAKPOINT}
+        # Track the full conversation history; memory formation still sees the persona
+        conversation_history = [{"role": "user", "content": system + "\n\n" + prompt}]
         
         # Add loop counter to limit iterations
         loop_count = 0
         max_loops = 4
+        recorded_memory = None
         
         while loop_count < max_loops:
             # Increment loop counter
             loop_count += 1
             
             # Make API call to Claude
-            response = await self.anthropic.messages.create(
+            response = await self.llm.create(
+                DECISION,
                 model=self.model,
                 max_tokens=self.max_tokens,
+                system=[{"type": "text", "text": system, "cache_control": CACHE_BREAKPOINT}],
                 messages=messages,
                 tools=available_tools,
                 temperature=self.temp
@@ -99,16 +144,21 @@ class PersonV2:
             
             # Process and store assistant response
             assistant_message_content = []
-            has_tool_calls = False
+            tool_uses = []
             
             for content in response.content:
                 if content.type == 'text':
                     assistant_message_content.append(content)
                 elif content.type == 'tool_use':
-                    has_tool_calls = True
                     assistant_message_content.append(content)
-                    
-                    # Execute tool call
+                    tool_uses.append(content)
+            has_tool_calls = bool(tool_uses)
+            
+            if has_tool_calls:
+                # Answer every tool call of the response: local tools right away, MCP tools concurrently
+                result_contents = [None] * len(tool_uses)
+                mcp_calls = []
+                for j, content in enumerate(tool_uses):
                     tool_name = content.name
                     # Handle both dictionary and object formats for tool arguments
                     if hasattr(content.input, '__getitem__'):
@@ -117,43 +167,50 @@ class PersonV2:
                         # Convert object to dict if it has attributes but not dict access
                         tool_args = vars(content.input) if hasattr(content.input, '__dict__') else content.input
 
-                    print(tool_name)
-                    print(tool_args)
+                    logger.debug(f"Person {self.id} called {tool_name} with {tool_args}")
                     if tool_name == "make_decision":
                         if tool_args["decision"] not in self.options:
-                            result_content = f"Not a valid decision. Valid decisions are {self.options}"
+                            result_contents[j] = f"Not a valid decision. Valid decisions are {self.options}"
                         else:
                             self.decision = tool_args["decision"]
-                            result_content = "Decision made: " + self.decision
+                            result_contents[j] = "Decision made: " + self.decision
+                    elif tool_name == "record_memory" and fused:
+                        recorded_memory = tool_args["memory"]
+                        result_contents[j] = "Memory recorded."
                     else:
-                        try:
-                            result = await mcp_session.call_tool(tool_name, tool_args)
-                            result_content = result.content
-                        except:
-                            result_content = "Tool call failed. Don't try again."
-                      
-                    # Add assistant message with tool call to messages
-                    messages.append({
-                        "role": "assistant",
-                        "content": assistant_message_content
-                    })
-                    
-                    # Add tool result to messages
-                    messages.append({
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "tool_result",
-                                "tool_use_id": content.id,
-                                "content": result_content 
-                            }
-                        ]
-                    })
-                    
-                    # Update conversation history
-                    conversation_history.extend(messages[-2:])
-                    break
+                        mcp_calls.append((j, self._call_tool(mcp_session, tool_name, tool_args, loop_count)))
+
+                if mcp_calls:
+                    results = await asyncio.gather(*(call for _, call in mcp_calls))
+                    for (j, _), result_content in zip(mcp_calls, results):
+                        result_contents[j] = result_content
+                  
+                # Add assistant message with tool calls to messages
+                messages.append({
+                    "role": "assistant",
+                    "content": assistant_message_content
+                })
+                
+                # Add all tool results to messages in one user turn
+                messages.append({
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "tool_result",
+                            "tool_use_id": content.id,
+                            "content": result_content 
+                        }
+                        for content, result_content in zip(tool_uses, result_contents)
+                    ]
+                })
+                
+                # Update conversation history
+                conversation_history.extend(messages[-2:])
             
+            # record_memory ends the turn, so there's no need to send its result back
+            if recorded_memory is not None:
+                break
+
             # If no tool calls, we're done with the loop
             if not has_tool_calls:
                 # Add final assistant message to conversation history
@@ -163,8 +220,10 @@ class PersonV2:
                 })
                 break
                 
+        max_loops_reached = loop_count >= max_loops and has_tool_calls and recorded_memory is None
+        tracing.current_span().set(rounds=loop_count, max_loops_reached=max_loops_reached)
         # If we reached the maximum number of loops, add a note about it
-        if loop_count >= max_loops and has_tool_calls:
+        if max_loops_reached:
             logger.warning(f"Maximum number of tool call loops ({max_loops}) reached for person {self.id}")
             # Add the last assistant message to conversation history if it wasn't added
             conversation_history.append({
@@ -172,11 +231,29 @@ class PersonV2:
                 "content": assistant_message_content
             })
         
-        # Update memory with the conversation history
-        new_memory = await self.update(conversation_history)
+        if recorded_memory is not None:
+            new_memory = "\n\n" + recorded_memory
+            self.memory.add(recorded_memory)
+        else:
+            # Update memory with the conversation history
+            new_memory = await self.update(conversation_history)
         
         return (self.decision, new_memory)
 
+    async def _call_tool(self, mcp_session: MCPCache, tool_name, tool_args, loop_count):
+        """ Calls an MCP tool and returns the content for its tool_result. """
+        metrics.mcp_in_flight.inc()
+        try:
+            with metrics.mcp_tool_call_seconds.time(tool=tool_name), \
+                    tracing.span("call_tool", tool=tool_name, round=loop_count):
+                result = await mcp_session.call_tool(tool_name, tool_args)
+            return result.content
+        except Exception:
+            metrics.mcp_tool_errors_total.inc(tool=tool_name)
+            return "Tool call failed. Don't try again."
+        finally:
+            metrics.mcp_in_flight.dec()
+
     async def update(self, llm_call_sequence):
         """ Updates the person's memory. This function should parse the LLM call result,
         and update the history instance attribute.
@@ -215,21 +292,23 @@ class PersonV2:
                 conversation_text += f"{role.capitalize()}: {content}\n\n"
         
         # Use the memory model to generate a memory from the conversation
-        memory_response = await self.anthropic.messages.create(
-            model=self.memory_model,
-            max_tokens=1024,
-            messages=[
-                {
-                    "role": "user",
-                    "content": memory_prompt.format(conversation=conversation_text)
-                }
-            ],
-            temperature=0.7
-        )
+        with metrics.memory_update_seconds.time(), tracing.span("update"):
+            memory_response = await self.llm.create(
+                MEMORY,
+                model=self.memory_model,
+                max_tokens=1024,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": memory_prompt.format(conversation=conversation_text)
+                    }
+                ],
+                temperature=0.7
+            )
         
         # Extract the memory from the response
         new_memory = "\n\n" + memory_response.content[0].text
-        self.memory += new_memory
+        self.memory.add(memory_response.content[0].text)
 
         return new_memory
 
@@ -0,0 +1,72 @@
+import asyncio
+import numpy as np
+
+from mcp_cache import MCPCache
+from person import PersonV2, assemble_sys_prompt
+
+DEFAULT_OPTIONS = ["Andrew Cuomo", "Zohran Mamdani", "Eric Adams", "Curtis Sliwa", "Undecided"] # Should update to get this from mcp resource
+
+
+def sample_features(demographic_features, num_people, seed=None):
+    """ Samples every agent's features at once.
+
+    Args:
+        demographic_features: the `demographic_info` lists of [name, weight] pairs, one per category.
+        num_people: number of agents to sample.
+        seed: seed for the generator; the same seed gives the same population.
+
+    Returns:
+        An (num_people, num_categories) array of indices into each category.
+    """
+    rng = np.random.default_rng(seed)
+    codes = np.empty((num_people, len(demographic_features)), dtype=np.int16)
+    for j, feature_category in enumerate(demographic_features):
+        weights = np.array([item[1] for item in feature_category], dtype=float)
+        codes[:, j] = rng.choice(len(feature_category), size=num_people, p=weights / weights.sum())
+    return codes
+
+
+async def fetch_feature_prompts(mcp_session: MCPCache, names):
+    """ Fetches the prompt text for each distinct feature name concurrently. """
+    names = list(dict.fromkeys(names))
+    responses = await asyncio.gather(*(mcp_session.get_prompt(name) for name in names))
+    return {name: str(r.messages[0].content.text) for name, r in zip(names, responses)}
+
+
+async def build_combos(mcp_session: MCPCache, demographic_features, base_prompt, codes):
+    """ Builds the feature names and system prompt of each distinct feature combination in `codes`.
+
+    Each distinct feature prompt is fetched once and each combination's system
+    prompt is assembled once, to be shared by every agent with that combination.
+
+    Returns:
+        (combo_features, combo_prompts, inverse), where inverse maps each row of codes to its combination.
+    """
+    combos, inverse = np.unique(codes, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    combo_features = [
+        [demographic_features[j][code][0] for j, code in enumerate(combo)]
+        for combo in combos.tolist()
+    ]
+    feature_prompts = await fetch_feature_prompts(mcp_session, [f for features in combo_features for f in features])
+    combo_prompts = [assemble_sys_prompt(base_prompt, features, feature_prompts) for features in combo_features]
+    return combo_features, combo_prompts, inverse
+
+
+async def build_population(mcp_session: MCPCache, demographic_features, base_prompt, options, num_people, seed=None):
+    """ Creates `num_people` agents with sampled features and their system prompts.
+
+    Returns:
+        (people, codes), where codes is the feature array from `sample_features`.
+    """
+    codes = sample_features(demographic_features, num_people, seed)
+    combo_features, combo_prompts, inverse = await build_combos(mcp_session, demographic_features, base_prompt, codes)
+
+    people = []
+    for combo in inverse.tolist():
+        person = PersonV2(combo_features[combo])
+        person.sys_prompt = combo_prompts[combo]
+        person.options = options
+        people.append(person)
+    return people, codes
@@ -0,0 +1,103 @@
+import json
+
+import msgpack
+import numpy as np
+
+JSON = "json"
+MSGPACK = "msgpack"
+MEDIA_TYPES = {JSON: "application/json", MSGPACK: "application/msgpack"}
+
+
+class ResultsStore:
+    """ Every agent's decision after every recorded turn, as one int16 code per agent.
+
+    Rows are turns and columns agents, in the same order as `feature_codes`, so
+    tallies, crosstabs, switch matrices and time series are all a single
+    `np.bincount` over a slice of the matrix, whatever the population size.
+    """
+
+    def __init__(self, demographic_features, feature_codes, options):
+        self.demographic_features = demographic_features
+        self.feature_codes = np.asarray(feature_codes, dtype=np.int16)
+        self.options = list(options)
+        self._codes = {option: i for i, option in enumerate(self.options)}
+        self.turns = []
+        self._index = {}
+        self._decisions = np.empty((16, len(self.feature_codes)), dtype=np.int16)
+
+    def _code(self, decision):
+        if decision not in self._codes:
+            self._codes[decision] = len(self.options)
+            self.options.append(decision)
+        return self._codes[decision]
+
+    def record(self, turn, people):
+        """ Stores the decisions `people` hold after `turn`, replacing an earlier record of it. """
+        row = np.array([self._code(p.decision) for p in people], dtype=np.int16)
+        if turn in self._index:
+            self._decisions[self._index[turn]] = row
+            return
+        if len(self.turns) == len(self._decisions):
+            grown = np.empty((2 * len(self._decisions), self._decisions.shape[1]), dtype=np.int16)
+            grown[:len(self.turns)] = self._decisions[:len(self.turns)]
+            self._decisions = grown
+        self._index[turn] = len(self.turns)
+        self._decisions[len(self.turns)] = row
+        self.turns.append(turn)
+
+    def decisions(self, turn=None):
+        """ Decision codes after `turn` (default: the latest recorded); KeyError if it wasn't recorded. """
+        if turn is None:
+            if not self.turns:
+                raise KeyError("No turns recorded")
+            turn = self.turns[-1]
+        return self._decisions[self._index[turn]]
+
+    def tallies(self, turn=None):
+        return np.bincount(self.decisions(turn), minlength=len(self.options))
+
+    def crosstab(self, category, turn=None):
+        """ (feature values of `category`) x (options) counts. """
+        values = len(self.demographic_features[category])
+        k = len(self.options)
+        cells = self.feature_codes[:, category].astype(np.int64) * k + self.decisions(turn)
+        return np.bincount(cells, minlength=values * k).reshape(values, k)
+
+    def switches(self, from_turn, to_turn=None):
+        """ (decision after `from_turn`) x (decision after `to_turn`) counts. """
+        k = len(self.options)
+        cells = self.decisions(from_turn).astype(np.int64) * k + self.decisions(to_turn)
+        return np.bincount(cells, minlength=k * k).reshape(k, k)
+
+    def series(self):
+        """ (recorded turns) x (options) tallies. """
+        k = len(self.options)
+        decisions = self._decisions[:len(self.turns)].astype(np.int64)
+        cells = decisions + k * np.arange(len(self.turns))[:, None]
+        return np.bincount(cells.ravel(), minlength=len(self.turns) * k).reshape(len(self.turns), k)
+
+
+def _plain(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Not serializable: {type(value).__name__}")
+
+
+def _packed(value):
+    # Arrays go out as raw little-endian buffers; the client rebuilds them from dtype and shape
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        return {"dtype": value.dtype.newbyteorder("<").str, "shape": list(value.shape),
+                "data": value.astype(value.dtype.newbyteorder("<"), copy=False).tobytes()}
+    return _plain(value)
+
+
+def encode(payload, fmt=JSON):
+    """ Serializes an analytics payload that may hold NumPy arrays; returns (body, media type). """
+    if fmt == MSGPACK:
+        return msgpack.packb(payload, default=_packed), MEDIA_TYPES[MSGPACK]
+    if fmt == JSON:
+        return json.dumps(payload, default=_plain).encode(), MEDIA_TYPES[JSON]
+    raise ValueError(f"Unknown format {fmt}, expected one of {list(MEDIA_TYPES)}")
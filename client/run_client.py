@@ -1,20 +1,20 @@
-from person import PersonV2
-from mcp import ClientSession
-from mcp.client.sse import sse_client
+from population import build_population
+from llm import get_llm
+from mcp_cache import MCPCache
+from transport import open_mcp_session
+from turn import iter_turn, STRAGGLER, INACTIVE
 import concurrent.futures
 import asyncio
 from pydantic import AnyUrl
 from contextlib import AsyncExitStack
 import json
-import random
 import logging
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-async def run_client(mcp_session: ClientSession, num_people: int, num_turns: int):
-    people = []
+async def run_client(mcp_session: MCPCache, num_people: int, num_turns: int):
     try:
         logger.info("Reading initial resource")
         features = await mcp_session.read_resource("resource://init")
@@ -23,60 +23,35 @@ async def run_client(mcp_session: ClientSession, num_people: int, num_turns: int
         base_prompt= features_json['context']
 
         logger.info("Creating people")
-        for _ in range(num_people):
-            # Sample a feature from each category based on probabilities
-            sampled_features = []
-            for feature_category in features:
-                # Extract feature names and their probabilities
-                feature_names = [item[0] for item in feature_category]
-                probabilities = [item[1] for item in feature_category]
-                
-                # Normalize probabilities to ensure they sum to 100
-                total = sum(probabilities)
-                normalized_probs = [p/total for p in probabilities]
-                
-                # Sample one feature based on the probabilities
-                selected_feature = random.choices(feature_names, weights=normalized_probs, k=1)[0]
-                
-                # Add to feature list
-                sampled_features.append(selected_feature)
-            
-            # Create a person with the sampled features
-            logger.info(f"Creating person with features: {sampled_features}")
-            people.append(PersonV2(sampled_features))
-            
-            await people[-1].generate_sys_prompt(base_prompt, mcp_session)
+        options = features_json.get('options', []) + ["Undecided"]
+        people, _ = await build_population(mcp_session, features, base_prompt, options, num_people)
         
         # Use the correct URI format for read_resource
         next_turn_uri = "resource://next_timestep"
         logger.info(f"Getting next turn context from {next_turn_uri}")
-        new_turn_ctx = await mcp_session.read_resource(next_turn_uri)
+        new_turn_ctx = await mcp_session.read_resource(next_turn_uri, retry=False)
 
         for turn in range(num_turns):
             logger.info(f"Starting turn {turn+1}/{num_turns}")
-            # Create tasks for all persons
-            tasks = []
-            for i, person in enumerate(people):
-                logger.info(f"Creating task for person {i+1}")
-                tasks.append(person.call_llm(mcp_session, new_turn_ctx.contents))
-            
-            # Wait for all tasks to complete with error handling
+            await mcp_session.refresh()
+            # Run every person's turn; cut-off agents keep their previous decision
             try:
                 logger.info("Waiting for all tasks to complete")
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-                
-                # Check for exceptions in results
-                for i, result in enumerate(results):
-                    if isinstance(result, Exception):
-                        logger.error(f"Error in person {i+1} task: {result}")
+                results = []
+                async for i, decision, memory_update, status in iter_turn(people, mcp_session, new_turn_ctx.contents, turn=turn+1):
+                    if status == STRAGGLER:
+                        logger.warning(f"Person {i+1} did not finish the turn, keeping decision {decision}")
+                    elif status == INACTIVE:
+                        logger.info(f"Person {i+1} was not activated this turn, keeping decision {decision}")
                     else:
                         logger.info(f"Person {i+1} task completed successfully")
+                    results.append((i, decision, memory_update))
                 
                 print(results)
                 
                 # Call the next_turn resource
                 logger.info("Getting next turn context")
-                new_turn_ctx = await mcp_session.read_resource(next_turn_uri)
+                new_turn_ctx = await mcp_session.read_resource(next_turn_uri, retry=False)
             except Exception as e:
                 logger.error(f"Error during task execution: {e}")
                 raise
@@ -91,22 +66,9 @@ async def main():
     exit_stack = AsyncExitStack()
     
     try:
-        print("Starting SSE client...")
-        # Increase timeouts for SSE connection
-        sse_transport = await exit_stack.enter_async_context(
-            sse_client("http://127.0.0.1:8000/sse", 
-                      timeout=30,  # Increase connection timeout
-                      sse_read_timeout=300)  # Increase read timeout to 5 minutes
-        )
-        read_stream, write_stream = sse_transport
-        
-        # Create a ClientSession with the streams
-        logger.info("Creating client session")
-        mcp_session = await exit_stack.enter_async_context(ClientSession(read_stream, write_stream))
-        
-        # Initialize the session
-        logger.info("Initializing session")
-        await mcp_session.initialize()
+        print("Starting MCP client pool...")
+        logger.info("Creating client session pool")
+        mcp_session = await open_mcp_session(exit_stack)
         
         # Run the client with the session
         logger.info("Running client")
@@ -117,6 +79,7 @@ async def main():
     finally:
         logger.info("Closing resources")
         await exit_stack.aclose()
+        await get_llm().aclose()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
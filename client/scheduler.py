@@ -0,0 +1,216 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import random
+import time
+
+import metrics
+import tracing
+from config import ConcurrencyConfig
+
+logger = logging.getLogger(__name__)
+
+# Lower number = served first. Decision calls should never wait behind
+# memory formation for the same turn.
+DECISION = 0
+MEMORY = 1
+COMPACTION = 2
+
+PRIORITY_NAMES = {DECISION: "decision", MEMORY: "memory", COMPACTION: "compaction"}
+
+RATE_LIMIT_STATUSES = (429, 529)
+
+
+def estimate_tokens(*parts):
+    """Rough input token count (~4 characters per token) used to reserve budget
+    before a request is sent. The real count from `usage` is reconciled afterwards."""
+    chars = 0
+    for part in parts:
+        if part is None:
+            continue
+        chars += len(part) if isinstance(part, str) else len(json.dumps(part, default=str))
+    return chars // 4 + 1
+
+
+def _is_rate_limited(e):
+    return getattr(e, "status_code", None) in RATE_LIMIT_STATUSES
+
+
+def _retry_after(e):
+    response = getattr(e, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Per-minute budget that refills continuously. The balance may go negative
+    when actual usage exceeds the reservation; callers then wait it out."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount):
+        """Seconds until `amount` can be taken from the bucket."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        self._refill()
+        self.tokens -= amount
+
+
+class LLMScheduler:
+    """Admission control for LLM requests.
+
+    Caps in-flight requests, keeps requests/input tokens/output tokens within
+    their per-minute budgets and serves waiters in priority order. The in-flight
+    limit adapts AIMD-style: it grows by one after a window of clean responses
+    and halves on every 429/529, with all admissions paused for the backoff.
+    """
+
+    def __init__(self, config: ConcurrencyConfig = None):
+        self.config = config or ConcurrencyConfig.from_env()
+        self.limit = self.config.max_in_flight
+        self.in_flight = 0
+        self._requests = TokenBucket(self.config.requests_per_minute)
+        self._input_tokens = TokenBucket(self.config.input_tokens_per_minute)
+        self._output_tokens = TokenBucket(self.config.output_tokens_per_minute)
+        self._waiters = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._timer = None
+        self._timer_at = 0.0
+        self._successes = 0
+        metrics.llm_in_flight.set_function(lambda: self.in_flight)
+        metrics.llm_queued.set_function(lambda: sum(not w[3].done() for w in self._waiters))
+        metrics.llm_concurrency_limit.set_function(lambda: self.limit)
+
+    async def submit(self, fn, priority=DECISION, tokens=0):
+        """Run `fn()` (a coroutine factory) once admitted, retrying on rate limits.
+
+        Args:
+            fn: zero-argument callable returning the awaitable request.
+            priority: DECISION, MEMORY or COMPACTION; lower values are admitted first.
+            tokens: estimated input tokens for the request.
+        """
+        attempt = 0
+        kind = PRIORITY_NAMES.get(priority, str(priority))
+        span = tracing.current_span()
+        queued = 0.0
+        while True:
+            start = time.perf_counter()
+            await self._acquire(priority, tokens)
+            waited = time.perf_counter() - start
+            metrics.llm_queue_seconds.observe(waited, kind=kind)
+            queued += waited
+            span.set(queue_seconds=queued, attempts=attempt + 1)
+            try:
+                response = await fn()
+            except Exception as e:
+                if not _is_rate_limited(e) or attempt >= self.config.max_retries:
+                    self._release()
+                    raise
+                # Pause before releasing so the freed slot isn't handed straight out
+                self._on_rate_limited(e, attempt)
+                self._release()
+                metrics.llm_retries_total.inc()
+                attempt += 1
+                continue
+            except BaseException:
+                self._release()
+                raise
+            self._release()
+            self._on_success(response, tokens)
+            return response
+
+    async def _acquire(self, priority, tokens):
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), tokens, fut))
+        self._dispatch()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # Admitted just as we were cancelled: hand the slot back.
+            if fut.done() and not fut.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self._waiters and self.in_flight < self.limit:
+            _, _, tokens, fut = self._waiters[0]
+            if fut.done():
+                heapq.heappop(self._waiters)
+                continue
+            wait = max(
+                self._paused_until - now,
+                self._requests.delay(1),
+                self._input_tokens.delay(tokens),
+                self._output_tokens.delay(0),
+            )
+            if wait > 0:
+                self._schedule(wait)
+                return
+            heapq.heappop(self._waiters)
+            self._requests.consume(1)
+            self._input_tokens.consume(tokens)
+            self.in_flight += 1
+            fut.set_result(None)
+
+    def _schedule(self, delay):
+        at = time.monotonic() + delay
+        if self._timer is not None:
+            if self._timer_at <= at:
+                return
+            self._timer.cancel()
+        self._timer_at = at
+        self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def _on_success(self, response, tokens):
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            # Prompt-cache reads don't count against the input token limit; cache writes do
+            used = (getattr(usage, "input_tokens", 0) or 0) + (getattr(usage, "cache_creation_input_tokens", 0) or 0)
+            self._input_tokens.consume(used - tokens)
+            self._output_tokens.consume(getattr(usage, "output_tokens", 0))
+        self._successes += 1
+        if self._successes >= self.limit and self.limit < self.config.max_in_flight:
+            self.limit += 1
+            self._successes = 0
+
+    def _on_rate_limited(self, e, attempt):
+        metrics.llm_rate_limited_total.inc(status=getattr(e, "status_code", None))
+        self.limit = max(self.config.min_in_flight, self.limit // 2)
+        self._successes = 0
+        backoff = _retry_after(e)
+        if backoff is None:
+            backoff = min(self.config.max_backoff, self.config.base_backoff * 2 ** attempt)
+            backoff *= random.uniform(0.5, 1.0)
+        self._paused_until = max(self._paused_until, time.monotonic() + backoff)
+        logger.warning(f"Rate limited ({getattr(e, 'status_code', None)}), concurrency now {self.limit}, "
+                       f"pausing {backoff:.1f}s")
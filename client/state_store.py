@@ -0,0 +1,107 @@
+import json
+import os
+
+import numpy as np
+
+from person import PersonV2
+
+STATE_VERSION = 1
+
+
+def snapshot_state(people, feature_codes, demographic_features, turn):
+    """ Captures the population as a few flat arrays plus a JSON header.
+
+    Agents that share a feature combination share a system prompt, so prompts
+    are stored once per combination. Call this between turns, on the event
+    loop, then hand the result to `write_state` (which is safe in a thread).
+    """
+    options = []
+    for person in people:
+        for option in person.options:
+            if option not in options:
+                options.append(option)
+    decisions = list(options)
+    for person in people:
+        if person.decision not in decisions:
+            decisions.append(person.decision)
+    decision_index = {d: i for i, d in enumerate(decisions)}
+
+    prompts = {}
+    for person, codes in zip(people, feature_codes.tolist()):
+        prompts.setdefault(tuple(codes), person.sys_prompt)
+
+    header = {
+        "version": STATE_VERSION,
+        "turn": turn,
+        "demographic_info": demographic_features,
+        "options": options,
+        "decisions": decisions,
+        "prompts": [[list(codes), prompt] for codes, prompt in prompts.items()],
+        "person": {
+            "model": people[0].model,
+            "memory_model": people[0].memory_model,
+            "max_tokens": people[0].max_tokens,
+            "memory_token_budget": people[0].memory.token_budget,
+            "memory_mode": people[0].memory_mode,
+        },
+    }
+    memories = [person.memory.to_state() for person in people]
+    return {
+        "header": np.frombuffer(json.dumps(header).encode(), dtype=np.uint8),
+        "feature_codes": np.asarray(feature_codes, dtype=np.int16),
+        "decisions": np.array([decision_index[p.decision] for p in people], dtype=np.int16),
+        "temps": np.array([p.temp for p in people], dtype=np.float32),
+        "last_active": np.array([-1 if p.last_active is None else p.last_active for p in people], dtype=np.int32),
+        "unchanged": np.array([p.unchanged for p in people], dtype=np.int16),
+        "memories": np.frombuffer(json.dumps(memories).encode(), dtype=np.uint8),
+    }
+
+
+def write_state(path, arrays):
+    """ Writes a snapshot atomically: a crash mid-write leaves the previous checkpoint intact. """
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+
+def load_state(path):
+    """ Rebuilds a population from a checkpoint without touching the MCP server.
+
+    Returns:
+        (people, feature_codes, demographic_features, turn)
+    """
+    with np.load(path) as data:
+        header = json.loads(data["header"].tobytes())
+        feature_codes = data["feature_codes"]
+        decisions = data["decisions"].tolist()
+        temps = data["temps"].tolist()
+        memories = json.loads(data["memories"].tobytes())
+        # Checkpoints from before sparse activation have no activation state
+        last_active = data["last_active"].tolist() if "last_active" in data.files else [-1] * len(decisions)
+        unchanged = data["unchanged"].tolist() if "unchanged" in data.files else [0] * len(decisions)
+    if header["version"] != STATE_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {header['version']}")
+
+    demographic_features = header["demographic_info"]
+    prompts = {tuple(codes): prompt for codes, prompt in header["prompts"]}
+    combo_features = {
+        codes: [demographic_features[j][code][0] for j, code in enumerate(codes)]
+        for codes in prompts
+    }
+    options = header["options"]
+    names = header["decisions"]
+    settings = header["person"]
+
+    people = []
+    for codes, decision, temp, memory, active, stable in zip(
+            map(tuple, feature_codes.tolist()), decisions, temps, memories, last_active, unchanged):
+        person = PersonV2(combo_features[codes], temp=temp, **settings)
+        person.sys_prompt = prompts[codes]
+        person.options = options
+        person.decision = names[decision]
+        person.memory.load_state(memory)
+        person.last_active = None if active < 0 else active
+        person.unchanged = stable
+        people.append(person)
+    return people, feature_codes, demographic_features, header["turn"]
@@ -0,0 +1,146 @@
+"""Offline profiler for turn traces written with TRACE_FILE (see tracing.py).
+
+    python trace_report.py traces.jsonl              # the last turn in the file
+    python trace_report.py traces.jsonl --turn 0     # the first one
+    python trace_report.py traces.jsonl --all        # every turn
+
+For each turn it reports the critical path (the slowest agent, broken into its
+spans), the slowest agents, where agent time goes by stage, the time spent by
+agents that ran into the max_loops tool-call limit, and LLM queueing versus
+service time.
+"""
+import argparse
+import json
+from collections import defaultdict
+
+
+def load_traces(path):
+    """ Returns {traceId: [span, ...]} with every span's duration in seconds under "seconds". """
+    traces = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            span = json.loads(line)
+            span["seconds"] = (span["endTimeUnixNano"] - span["startTimeUnixNano"]) / 1e9
+            traces[span["traceId"]].append(span)
+    return traces
+
+
+def turns(traces):
+    """ Returns the traces that have a "turn" root span, oldest first. """
+    rooted = []
+    for spans in traces.values():
+        root = next((s for s in spans if s["name"] == "turn" and s["parentSpanId"] is None), None)
+        if root is not None:
+            rooted.append((root, spans))
+    return sorted(rooted, key=lambda pair: pair[0]["startTimeUnixNano"])
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def _label(span):
+    attrs = span.get("attributes") or {}
+    extra = [f"{k}={attrs[k]}" for k in ("kind", "tool", "round") if k in attrs]
+    if "queue_seconds" in attrs:
+        extra.append(f"queued {attrs['queue_seconds']:.3f}s")
+    return span["name"] + (f" ({', '.join(extra)})" if extra else "")
+
+
+def _stage(span):
+    attrs = span.get("attributes") or {}
+    if span["name"] == "llm":
+        return f"llm ({attrs.get('kind')})"
+    if span["name"] == "call_tool":
+        return f"call_tool ({attrs.get('tool')})"
+    return span["name"]
+
+
+def _print_tree(span, children, turn_start, depth=1):
+    offset = (span["startTimeUnixNano"] - turn_start) / 1e9
+    print(f"  {'  ' * depth}{_label(span):<48} +{offset:8.3f}s {span['seconds']:8.3f}s")
+    for child in sorted(children[span["spanId"]], key=lambda s: s["startTimeUnixNano"]):
+        _print_tree(child, children, turn_start, depth + 1)
+
+
+def report(root, spans, top=10):
+    children = defaultdict(list)
+    for span in spans:
+        if span["parentSpanId"] is not None:
+            children[span["parentSpanId"]].append(span)
+    agents = [s for s in spans if s["name"] == "agent_turn"]
+    attrs = root.get("attributes") or {}
+    turn = f"turn {attrs['turn']}" if "turn" in attrs else "turn"
+    print(f"== {turn} ({root['traceId'][:8]}): {root['seconds']:.3f}s, {len(agents)} agents")
+    if not agents:
+        return
+
+    # The turn ends when its slowest agent does, so that agent is the critical path
+    critical = max(agents, key=lambda s: s["endTimeUnixNano"])
+    print(f"\nCritical path: agent {critical['attributes'].get('agent')}")
+    _print_tree(critical, children, root["startTimeUnixNano"])
+
+    print(f"\nSlowest agents (p50 {_percentile([a['seconds'] for a in agents], 0.5):.3f}s, "
+          f"p99 {_percentile([a['seconds'] for a in agents], 0.99):.3f}s):")
+    for agent in sorted(agents, key=lambda s: s["seconds"], reverse=True)[:top]:
+        a = agent["attributes"]
+        print(f"  {a.get('agent')}  {agent['seconds']:8.3f}s  rounds={a.get('rounds')}"
+              f"{'  max_loops' if a.get('max_loops_reached') else ''}")
+
+    # Stage totals over the direct and nested spans of every agent
+    by_stage = defaultdict(list)
+    agent_ids = {a["spanId"] for a in agents}
+    stack = [s for s in spans if s["parentSpanId"] in agent_ids]
+    while stack:
+        span = stack.pop()
+        by_stage[_stage(span)].append(span["seconds"])
+        stack.extend(children[span["spanId"]])
+    agent_total = sum(a["seconds"] for a in agents)
+    print("\nTime by stage (summed over agents; nested stages overlap their parents):")
+    for stage, durations in sorted(by_stage.items(), key=lambda kv: -sum(kv[1])):
+        total = sum(durations)
+        print(f"  {stage:<22} {total:10.3f}s {100 * total / agent_total:6.1f}%  n={len(durations):<6} "
+              f"p50 {_percentile(durations, 0.5):.3f}s  p99 {_percentile(durations, 0.99):.3f}s")
+
+    looped = [a for a in agents if a["attributes"].get("max_loops_reached")]
+    looped_time = sum(a["seconds"] for a in looped)
+    print(f"\nmax_loops: {len(looped)} agents hit the tool-call limit, "
+          f"{looped_time:.3f}s of agent time ({100 * looped_time / agent_total:.1f}%)")
+
+    llm = [s for s in spans if s["name"] == "llm"]
+    if llm:
+        queued = sum(s["attributes"].get("queue_seconds", 0.0) for s in llm)
+        total = sum(s["seconds"] for s in llm)
+        retried = sum(1 for s in llm if s["attributes"].get("attempts", 1) > 1)
+        print(f"LLM calls: {len(llm)}, {total:.3f}s total = {queued:.3f}s queued ({100 * queued / total if total else 0:.1f}%) "
+              f"+ {total - queued:.3f}s in service; {retried} retried after rate limits")
+        cache_read = sum(s["attributes"].get("cache_read_input_tokens", 0) for s in llm)
+        prompt = cache_read + sum(s["attributes"].get("input_tokens", 0) + s["attributes"].get("cache_creation_input_tokens", 0)
+                                  for s in llm)
+        hits = sum(1 for s in llm if s["attributes"].get("cache_read_input_tokens"))
+        print(f"Prompt cache: {hits}/{len(llm)} calls hit, {cache_read} of {prompt} input tokens "
+              f"({100 * cache_read / prompt if prompt else 0:.1f}%) read from cache")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace_file")
+    parser.add_argument("--turn", type=int, default=-1, help="index of the turn in the file (default: the last)")
+    parser.add_argument("--all", action="store_true", help="report every turn")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest agents to list")
+    args = parser.parse_args()
+
+    found = turns(load_traces(args.trace_file))
+    if not found:
+        parser.error(f"no turns in {args.trace_file}")
+    for root, spans in (found if args.all else [found[args.turn]]):
+        report(root, spans, args.top)
+        print()
+
+
+if __name__ == "__main__":
+    main()
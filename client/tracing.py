@@ -0,0 +1,125 @@
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Per-agent span tracing. Set TRACE_FILE to write one span per line as JSON, with
+# OTLP field names (traceId, spanId, parentSpanId, startTimeUnixNano, ...) and
+# attributes as a flat object. Every turn is its own trace. Read traces with
+# trace_report.py. When TRACE_FILE is unset, spans are no-ops.
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class _TraceWriter:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", buffering=1 << 16)
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+_writer = None
+
+
+def configure(path):
+    """ Starts writing spans to `path` (appending), or stops tracing if `path` is None. """
+    global _writer
+    if _writer is not None:
+        _writer.close()
+    _writer = _TraceWriter(path) if path else None
+
+
+def enabled():
+    return _writer is not None
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "attributes")
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.start = time.time_ns()
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        if _writer is None:
+            return
+        _writer.write({
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start,
+            "endTimeUnixNano": time.time_ns(),
+            "attributes": self.attributes,
+        })
+        if self.parent_id is None:
+            _writer.flush()
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def start_span(name, parent=None, **attributes):
+    """ Starts a span under `parent` (default: the current span) that the caller must end().
+    Unlike span(), it doesn't become the current span. """
+    if _writer is None:
+        return NOOP_SPAN
+    parent = parent or _current.get()
+    return Span(name, parent if isinstance(parent, Span) else None, attributes)
+
+
+@contextmanager
+def span(name, parent=None, **attributes):
+    """ Times the enclosed block as a child of `parent` (default: the current span). """
+    s = start_span(name, parent, **attributes)
+    if s is NOOP_SPAN:
+        yield s
+        return
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.set(error=repr(e))
+        raise
+    finally:
+        _current.reset(token)
+        s.end()
+
+
+def current_span():
+    return _current.get() or NOOP_SPAN
+
+
+configure(os.environ.get("TRACE_FILE"))
+atexit.register(lambda: _writer and _writer.flush())
@@ -0,0 +1,107 @@
+import importlib
+import importlib.util
+import logging
+import os
+import shlex
+import sys
+from contextlib import asynccontextmanager
+
+import anyio
+from mcp.client.sse import sse_client
+from mcp.client.stdio import StdioServerParameters, stdio_client
+from mcp.shared.memory import create_client_server_memory_streams
+
+from cassette import CassetteSession, open_cassette, RECORD, REPLAY
+from config import MCPConfig, CassetteConfig
+from mcp_cache import MCPCache
+from mcp_pool import MCPSessionPool
+
+logger = logging.getLogger(__name__)
+
+
+def load_server(spec):
+    """ Loads a server object from "path/to/server.py:attr" or "package.module:attr".
+
+    A file's directory is put on sys.path first, so servers that import their
+    sibling modules (like demo/ny_voting/server.py) load as they do standalone.
+    """
+    target, _, attr = spec.partition(":")
+    attr = attr or "mcp"
+    if target.endswith(".py"):
+        path = os.path.abspath(target)
+        sys.path.insert(0, os.path.dirname(path))
+        name = os.path.splitext(os.path.basename(path))[0]
+        module_spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(module_spec)
+        sys.modules[name] = module
+        module_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(target)
+    return getattr(module, attr)
+
+
+@asynccontextmanager
+async def inprocess_client(server):
+    """ Runs `server` (a FastMCP app or a low-level mcp Server) in this event loop and
+    yields (read_stream, write_stream) connected to it through memory streams. """
+    lowlevel = getattr(server, "_mcp_server", server)
+    async with create_client_server_memory_streams() as (client_streams, server_streams):
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(
+                lambda: lowlevel.run(server_streams[0], server_streams[1],
+                                     lowlevel.create_initialization_options(), raise_exceptions=False)
+            )
+            yield client_streams
+            tg.cancel_scope.cancel()
+
+
+def make_connector(config: MCPConfig):
+    """ Returns a zero-argument callable that opens one connection with the configured
+    transport, as MCPSessionPool expects. Every transport yields the same
+    (read_stream, write_stream) pair for a ClientSession.
+
+    - "sse": HTTP SSE to `config.url` (a separately launched server)
+    - "stdio": spawns `config.command` in `config.cwd` and talks over its stdin/stdout
+    - "inprocess": loads `config.server` into this process; no serialization over HTTP
+    """
+    if config.transport == "sse":
+        return lambda: sse_client(config.url, timeout=30, sse_read_timeout=300)
+    if config.transport == "stdio":
+        command, *args = shlex.split(config.command)
+        # Pass our environment through so the server sees the same settings (API keys, NEWS_BACKEND, ...)
+        params = StdioServerParameters(command=command, args=args, cwd=config.cwd, env=dict(os.environ))
+        return lambda: stdio_client(params)
+    if config.transport == "inprocess":
+        server = load_server(config.server)
+        return lambda: inprocess_client(server)
+    raise ValueError(f"Unknown MCP_TRANSPORT: {config.transport}")
+
+
+def pool_size(config: MCPConfig):
+    # Each stdio connection is its own server process with its own simulation clock,
+    # so a pool of them would disagree about the current day.
+    if config.transport == "stdio" and config.pool_size > 1:
+        logger.info("stdio transport: using a single MCP session")
+        return 1
+    return config.pool_size
+
+
+async def open_mcp_session(exit_stack, config: MCPConfig = None) -> MCPCache:
+    """ Opens the configured pool of MCP sessions behind a shared cache; the pool is
+    closed with `exit_stack`. The cache listens for list-changed notifications on every session. """
+    config = config or MCPConfig.from_env()
+    mcp_cache = MCPCache()
+    pool = MCPSessionPool(
+        make_connector(config),
+        size=pool_size(config),
+        message_handler=mcp_cache.handle_message,
+        request_timeout=config.request_timeout,
+        health_interval=config.health_interval,
+    )
+    exit_stack.push_async_callback(pool.close)
+    await pool.start()
+    mcp_cache.session = pool
+    cassette = CassetteConfig.from_env()
+    if cassette.mode in (RECORD, REPLAY):
+        mcp_cache.session = CassetteSession(pool, open_cassette(cassette.path), cassette.mode)
+    return mcp_cache
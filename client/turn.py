@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import math
+import time
+from collections import Counter
+
+from activation import ActivationPolicy
+from archetype import plan_archetypes, fan_out
+from config import ArchetypeConfig, TurnConfig
+from mcp_cache import MCPCache
+import metrics
+import tracing
+from metrics import TurnTimer
+
+logger = logging.getLogger(__name__)
+
+# How an agent's entry in a turn came about
+DONE = "done"  # ran its turn
+STRAGGLER = "straggler"  # cut off; keeps its previous decision
+INACTIVE = "inactive"  # not activated this turn; carries its state forward
+
+
+async def timed_call(timer: TurnTimer, person, mcp_session: MCPCache, ctx, turn_span=None):
+    """ Runs one agent's turn, recording its wall time in `timer` and its spans under `turn_span`. """
+    start = time.perf_counter()
+    with tracing.span("agent_turn", parent=turn_span, agent=str(person.id)):
+        result = await person.call_llm(mcp_session, ctx)
+    timer.agent_done(time.perf_counter() - start)
+    return result
+
+
+async def iter_turn(people, mcp_session: MCPCache, ctx, policy: TurnConfig = None, turn=None,
+                    activation: ActivationPolicy = None, archetypes: ArchetypeConfig = None,
+                    timer: TurnTimer = None, turn_span=None):
+    """ Runs one turn for the agents picked by `activation` and yields
+    (id, decision, memory_update, status) as each agent finishes, rather than
+    waiting for the slowest one.
+
+    With `archetypes.samples` set, active agents in identical states share their
+    runs (see archetype.py): the agents copying a run are yielded right after it.
+
+    Agents the activation policy leaves idle are yielded first with status INACTIVE,
+    their current decision and no memory update. Agents that fail, pass
+    `policy.agent_deadline`, or are still running when the quorum closes the turn
+    are yielded last with status STRAGGLER, their previous decision and no memory
+    update. If the consumer stops early (e.g. the client disconnects), the agents
+    that are still running are cancelled.
+
+    To run one turn in several calls (e.g. batches of a sample), pass the turn's
+    `timer` and `turn_span`: the caller then finishes them and sets the per-turn
+    gauges and span attributes itself.
+    """
+    policy = policy or TurnConfig.from_env()
+    activation = activation or ActivationPolicy()
+    whole_turn = timer is None
+    if whole_turn:
+        timer = TurnTimer()
+        turn_span = tracing.start_span("turn", agents=len(people))
+        if turn is not None:
+            turn_span.set(turn=turn)
+    previous = [person.decision for person in people]
+    loop = asyncio.get_running_loop()
+
+    active, reasons = activation.select(people, ctx, turn)
+    for reason, count in reasons.items():
+        metrics.activations_total.inc(count, reason=reason)
+    if whole_turn:
+        metrics.last_turn_active_agents.set(len(active))
+        turn_span.set(active=len(active))
+    if len(active) < len(people):
+        activated = set(active)
+        for i, person in enumerate(people):
+            if i not in activated:
+                yield i, person.decision, None, INACTIVE
+
+    runners, followers = plan_archetypes(people, active, archetypes)
+    copies = sum(len(members) for members in followers.values())
+    metrics.archetype_copies_total.inc(copies)
+    if whole_turn:
+        turn_span.set(runners=len(runners))
+
+    async def run(i):
+        call = timed_call(timer, people[i], mcp_session, ctx, turn_span)
+        if policy.agent_deadline > 0:
+            result = await asyncio.wait_for(call, policy.agent_deadline)
+        else:
+            result = await call
+        if i in followers:
+            fan_out(people[i], [people[j] for j in followers[i]])
+        return result
+
+    tasks = {asyncio.create_task(run(i)): i for i in runners}
+    pending = set(tasks)
+    quorum = math.ceil(policy.quorum * len(active))
+    finished = 0
+    close_at = None
+    stragglers = []
+    try:
+        while pending:
+            timeout = None if close_at is None else max(0.0, close_at - loop.time())
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                i = tasks[task]
+                if task.cancelled() or task.exception() is not None:
+                    error = "cancelled" if task.cancelled() else repr(task.exception())
+                    logger.warning(f"Agent {i} did not finish its turn: {error}")
+                    stragglers.append(i)
+                    stragglers.extend(followers.get(i, []))
+                    continue
+                decision, memory_update = task.result()
+                for j in [i, *followers.get(i, [])]:
+                    finished += 1
+                    activation.record(people[j], previous[j], turn)
+                    yield j, decision, memory_update, DONE
+            if close_at is None and pending and finished >= quorum:
+                close_at = loop.time() + policy.quorum_grace
+
+        # Closed on quorum: whoever is left is a straggler
+        for task in pending:
+            task.cancel()
+        for task in pending:
+            stragglers.append(tasks[task])
+            stragglers.extend(followers.get(tasks[task], []))
+        pending = set()
+        metrics.turn_stragglers_total.inc(len(stragglers))
+        if whole_turn:
+            metrics.last_turn_stragglers.set(len(stragglers))
+            turn_span.set(stragglers=len(stragglers))
+        for i in sorted(stragglers):
+            # A cut-off agent may have decided before it stalled; keep its turn all-or-nothing
+            people[i].decision = previous[i]
+            yield i, previous[i], None, STRAGGLER
+    finally:
+        for task in tasks:
+            task.cancel()
+        if whole_turn:
+            timer.finish()
+            turn_span.end()
+
+
+class TurnTally:
+    """ Running count of decisions among the agents that have finished this turn. """
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.stragglers = 0
+        self.inactive = 0
+        self.counts = Counter()
+
+    def add(self, decision, status=DONE):
+        self.done += 1
+        self.stragglers += status == STRAGGLER
+        self.inactive += status == INACTIVE
+        self.counts[decision] += 1
+
+    def to_dict(self):
+        return {"done": self.done, "total": self.total, "stragglers": self.stragglers,
+                "inactive": self.inactive, "tallies": dict(self.counts)}
@@ -0,0 +1,99 @@
+import asyncio
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, TypeAdapter
+from typing import List, Tuple, Dict, Any, Optional
+from contextlib import AsyncExitStack
+from mcp.types import TextResourceContents, BlobResourceContents
+from models import RunTurnResponse
+from person import PersonV2
+from llm import get_llm
+from transport import open_mcp_session
+from turn import iter_turn, STRAGGLER, INACTIVE
+import metrics
+
+# A shard of the population, driven by coordinator.py. The worker has its own LLM
+# client and MCP sessions, but never advances the simulation itself: the coordinator
+# reads resource://next_timestep once per turn and sends the context to every worker.
+app = FastAPI()
+
+mcp_session = None
+exit_stack = None
+people = []
+person_ids = []  # global id of each local agent
+# Held through /shard/load and /shard/run_turn. The coordinator never overlaps them, so an
+# overlapping call comes from somewhere else and is refused rather than run on agents mid-turn.
+shard_lock = asyncio.Lock()
+
+resource_contents = TypeAdapter(List[TextResourceContents | BlobResourceContents])
+
+class ShardLoadRequest(BaseModel):
+    options: List[str]
+    combos: List[Tuple[List[str], str]]  # (features, system prompt) per feature combination
+    agents: List[Tuple[int, int]]  # (global id, combo index) per agent
+
+class ShardTurnRequest(BaseModel):
+    ctx: List[Dict[str, Any]]  # contents of resource://next_timestep
+    turn: Optional[int] = None  # simulation turn number, for the activation policy
+
+@app.on_event("startup")
+async def startup_event():
+    global mcp_session, exit_stack
+    exit_stack = AsyncExitStack()
+    mcp_session = await open_mcp_session(exit_stack)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if exit_stack:
+        await exit_stack.aclose()
+    await get_llm().aclose()
+
+@app.get("/health")
+async def health():
+    return {"num_people": len(people)}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def _check_idle():
+    if shard_lock.locked():
+        raise HTTPException(status_code=409, detail="This worker's shard is busy with another load or turn")
+
+@app.post("/shard/load")
+async def load(request: ShardLoadRequest):
+    """ Replaces this worker's agents with the given shard. """
+    global people, person_ids
+    _check_idle()
+    async with shard_lock:
+        people = []
+        person_ids = []
+        for person_id, combo in request.agents:
+            features, sys_prompt = request.combos[combo]
+            person = PersonV2(features)
+            person.sys_prompt = sys_prompt
+            person.options = request.options
+            people.append(person)
+            person_ids.append(person_id)
+        return {"num_people": len(people)}
+
+@app.post("/shard/run_turn", response_model=RunTurnResponse)
+async def run_turn(request: ShardTurnRequest):
+    _check_idle()
+    async with shard_lock:
+        if not people:
+            # Smaller populations than the worker count leave some workers without a shard
+            return RunTurnResponse(updates=[])
+        await mcp_session.refresh()
+        ctx = resource_contents.validate_python(request.ctx)
+        updates = []
+        stragglers = []
+        inactive = []
+        async for i, decision, memory_update, status in iter_turn(people, mcp_session, ctx, turn=request.turn):
+            updates.append((person_ids[i], {"memory": memory_update}, decision))
+            if status == STRAGGLER:
+                stragglers.append(person_ids[i])
+            elif status == INACTIVE:
+                inactive.append(person_ids[i])
+        return RunTurnResponse(updates=updates, stragglers=stragglers, inactive=inactive)
@@ -0,0 +1,140 @@
+"""Offline, date-partitioned news corpus for network-free runs.
+
+Snapshot a date range from Exa once:
+
+    python corpus.py snapshot --start 2025-05-10 --days 10
+
+then start the server with NEWS_BACKEND=local to answer search_election_news
+from a BM25 index over the snapshot instead of calling Exa.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+DEFAULT_CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+DEFAULT_QUERIES = [
+    "NYC mayoral election",
+    "Andrew Cuomo mayor",
+    "Zohran Mamdani mayor",
+    "Eric Adams mayor",
+    "Curtis Sliwa mayor",
+    "New York City politics",
+]
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class DayIndex:
+    """BM25 index over the articles published on one day."""
+
+    def __init__(self, articles, k1=1.5, b=0.75):
+        self.articles = articles
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)  # term -> [(doc, term frequency)]
+        self.lengths = []
+        for doc, article in enumerate(articles):
+            tokens = tokenize(f"{article['title']} {article['snippet']}")
+            self.lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings[term].append((doc, tf))
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def search(self, query, max_results):
+        n = len(self.articles)
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc] / self.avg_length)
+                scores[doc] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores, key=lambda doc: (-scores[doc], doc))[:max_results]
+        return [self.articles[doc] for doc in ranked]
+
+
+class LocalNewsIndex:
+    """Answers news searches from the corpus directory, one partition per date."""
+
+    def __init__(self, corpus_dir=DEFAULT_CORPUS_DIR):
+        self.corpus_dir = corpus_dir
+        self.days = {}
+
+    def day(self, date_str):
+        if date_str not in self.days:
+            path = os.path.join(self.corpus_dir, f"{date_str}.jsonl")
+            articles = []
+            if os.path.exists(path):
+                with open(path) as f:
+                    articles = [json.loads(line) for line in f if line.strip()]
+            self.days[date_str] = DayIndex(articles)
+        return self.days[date_str]
+
+    def search(self, query, date_str, max_results=5):
+        """Same result shape as search_election_news, restricted to articles from `date_str`."""
+        results = self.day(date_str).search(query, max_results)
+        return {
+            "query": query,
+            "date": date_str,
+            "results_count": len(results),
+            "results": results
+        }
+
+
+async def snapshot(start, days, queries, per_query, corpus_dir):
+    # Imported here so the index can be used without an Exa key
+    from server import _search_exa
+
+    os.makedirs(corpus_dir, exist_ok=True)
+    for offset in range(days):
+        date_str = (start + timedelta(days=offset)).strftime("%Y-%m-%d")
+        articles = {}
+        for query in queries:
+            response = await _search_exa(query, date_str, per_query)
+            for result in response["results"]:
+                articles.setdefault(result["url"] or result["title"], result)
+        with open(os.path.join(corpus_dir, f"{date_str}.jsonl"), "w") as f:
+            for article in articles.values():
+                f.write(json.dumps(article) + "\n")
+        print(f"{date_str}: {len(articles)} articles")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    snap = subparsers.add_parser("snapshot", help="download news for a date range into the corpus")
+    snap.add_argument("--start", default="2025-05-10", help="first simulated date (YYYY-MM-DD)")
+    snap.add_argument("--days", type=int, default=10)
+    snap.add_argument("--query", action="append", dest="queries", help="search query (repeatable)")
+    snap.add_argument("--per-query", type=int, default=25)
+    snap.add_argument("--corpus-dir", default=os.environ.get("NEWS_CORPUS_DIR", DEFAULT_CORPUS_DIR))
+
+    search = subparsers.add_parser("search", help="query the local index")
+    search.add_argument("date")
+    search.add_argument("query")
+    search.add_argument("--max-results", type=int, default=5)
+    search.add_argument("--corpus-dir", default=os.environ.get("NEWS_CORPUS_DIR", DEFAULT_CORPUS_DIR))
+
+    args = parser.parse_args()
+    if args.command == "snapshot":
+        start = datetime.strptime(args.start, "%Y-%m-%d")
+        asyncio.run(snapshot(start, args.days, args.queries or DEFAULT_QUERIES, args.per_query, args.corpus_dir))
+    else:
+        print(json.dumps(LocalNewsIndex(args.corpus_dir).search(args.query, args.date, args.max_results), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+import sys
+
 if __name__ == "__main__":
     from server import mcp
-    mcp.run(transport='sse')
+    # "sse" by default; "stdio" lets a client launch the server itself (MCP_TRANSPORT=stdio)
+    mcp.run(transport=sys.argv[1] if len(sys.argv) > 1 else 'sse')
@@ -0,0 +1,68 @@
+import asyncio
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_cache.sqlite3")
+
+
+class SearchCache:
+    """Two-tier cache for news search results.
+
+    An in-memory LRU sits in front of a SQLite file, so results survive restarts
+    and re-running a scenario never searches the same (query, date) twice.
+    Concurrent misses on the same key share a single upstream call.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_entries=4096):
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS searches (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.db.commit()
+        self._pending = {}
+
+    @staticmethod
+    def make_key(query, date, max_results):
+        normalized = " ".join(query.lower().split())
+        return json.dumps([normalized, date, max_results])
+
+    def get(self, key):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+        row = self.db.execute("SELECT value FROM searches WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value = json.loads(row[0])
+        self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO searches (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+        self.db.commit()
+        self._remember(key, value)
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    async def get_or_fetch(self, key, fetch):
+        """Returns the cached value for `key`, or awaits `fetch()` once and caches it."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        task = self._pending.get(key)
+        if task is None:
+            task = self._pending[key] = asyncio.ensure_future(self._fetch_and_store(key, fetch))
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch_and_store(self, key, fetch):
+        value = await fetch()
+        self.put(key, value)
+        return value
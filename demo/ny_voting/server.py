@@ -6,6 +6,8 @@ import os
 from dotenv import load_dotenv
 import asyncio
 from exa_py import Exa
+from search_cache import SearchCache, DEFAULT_PATH
+from corpus import LocalNewsIndex, DEFAULT_CORPUS_DIR
 
 # Create the FastMCP server
 mcp = FastMCP(name="NY Elections Server")
@@ -18,8 +20,16 @@ start_date = datetime(2025, 5, 10)  # May 10th, 2025
 load_dotenv()
 EXA_API_KEY = os.environ.get("EXA_API_KEY")
 
-# Initialize Exa client
-exa = Exa(EXA_API_KEY)
+# Where search_election_news gets its news: "exa" (live), "local" (offline corpus, see corpus.py)
+# or "replay" (only results an earlier "exa" run recorded in the search cache; Exa is never called)
+NEWS_BACKEND = os.environ.get("NEWS_BACKEND", "exa")
+
+# Initialize Exa client (not needed for offline runs)
+exa = Exa(EXA_API_KEY) if NEWS_BACKEND == "exa" else None
+news_index = LocalNewsIndex(os.environ.get("NEWS_CORPUS_DIR", DEFAULT_CORPUS_DIR))
+
+# Search results cache (in-memory LRU over a SQLite file that survives restarts)
+search_cache = SearchCache(os.environ.get("SEARCH_CACHE_PATH", DEFAULT_PATH))
 
 @mcp.tool()
 async def search_election_news(query: str, max_results: int = 5, ctx: Context = None) -> dict:
@@ -44,8 +54,27 @@ async def search_election_news(query: str, max_results: int = 5, ctx: Context =
     if ctx:
         await ctx.info(f"Searching for news: '{query}' on {current_date_str}")
 
-    # When calling the Exa API
-    search_results = exa.search_and_contents(
+    # Offline runs answer from the local index over that day's corpus partition
+    if NEWS_BACKEND == "local":
+        return news_index.search(query, current_date_str, max_results)
+
+    # Agents ask near-identical questions for the same day, so serve repeats from the cache
+    key = search_cache.make_key(query, current_date_str, max_results)
+    if NEWS_BACKEND == "replay":
+        result = search_cache.get(key)
+        if result is None:
+            return {"query": query, "date": current_date_str, "results_count": 0, "results": [],
+                    "error": "No recorded results for this search"}
+        return {**result, "query": query}
+    result = await search_cache.get_or_fetch(key, lambda: _search_exa(query, current_date_str, max_results, ctx))
+    return {**result, "query": query}
+
+
+async def _search_exa(query: str, current_date_str: str, max_results: int, ctx: Context = None) -> dict:
+    """Run the search against Exa for a single day and normalize the results."""
+    # When calling the Exa API. The client is synchronous, so keep it off the event loop
+    search_results = await asyncio.to_thread(
+        exa.search_and_contents,
         query,
         start_published_date=current_date_str,
         end_published_date=current_date_str,
@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+from archetype import fan_out, plan_archetypes
+from config import ArchetypeConfig, TurnConfig
+from llm import LLMClient, MockBackend
+from person import PersonV2
+from turn import DONE, iter_turn
+
+OPTIONS = ["A", "B", "Undecided"]
+
+
+class StubSession:
+    """ Just enough of an MCPCache for call_llm when the mock never calls an MCP tool. """
+
+    async def tool_schemas(self):
+        return []
+
+
+def _person(features, llm, **kwargs):
+    person = PersonV2(features, llm=llm, memory_mode="fused", **kwargs)
+    person.sys_prompt = "You are a voter."
+    person.options = OPTIONS
+    return person
+
+
+def test_plan_archetypes_groups_identical_agents():
+    llm = LLMClient(MockBackend(OPTIONS, seed=0))
+    people = [_person(["X"], llm) for _ in range(5)] + [_person(["Y"], llm) for _ in range(2)]
+    people[4].decision = "A"
+
+    runners, followers = plan_archetypes(people, range(7), ArchetypeConfig(samples=1))
+
+    assert runners == [0, 4, 5]
+    assert followers == {0: [1, 2, 3], 5: [6]}
+    assert plan_archetypes(people, range(7), ArchetypeConfig(samples=0)) == (list(range(7)), {})
+
+
+def test_fan_out_stops_a_members_stale_compaction():
+    async def main():
+        llm = LLMClient(MockBackend(OPTIONS, seed=0, latency=0.1))
+        source, member = _person(["X"], llm, memory_token_budget=60), _person(["X"], llm, memory_token_budget=60)
+        source.memory.load_state({"summaries": [], "entries": ["source memory"]})
+        source.decision = "B"
+        # The member ran last turn and is still folding its own memories
+        for n in range(6):
+            member.memory.add(f"member memory {n} " * 10)
+        stale = member.memory._task
+        assert stale is not None and not stale.done()
+
+        fan_out(source, [member])
+        await asyncio.sleep(0.5)
+
+        assert stale.cancelled()
+        assert member.decision == "B"
+        assert member.memory.to_state() == source.memory.to_state()
+        assert member.memory.entries is not source.memory.entries
+
+    asyncio.run(main())
+
+
+def test_fan_out_does_not_wait_for_the_sources_compaction():
+    async def main():
+        # An agent's turn takes two 0.1s requests, folding its 20 memories many more
+        llm = LLMClient(MockBackend(OPTIONS, seed=0, latency=0.1))
+        people = [_person(["X"], llm, memory_token_budget=60) for _ in range(4)]
+        for person in people:
+            person.memory.load_state({"summaries": [], "entries": ["an old memory " * 10] * 20})
+
+        start = time.perf_counter()
+        results = [r async for r in iter_turn(people, StubSession(), "day 1", TurnConfig(agent_deadline=0.5),
+                                              archetypes=ArchetypeConfig(samples=1))]
+        elapsed = time.perf_counter() - start
+
+        assert elapsed < 0.5
+        assert sorted(i for i, *_ in results) == [0, 1, 2, 3]
+        assert {status for *_, status in results} == {DONE}
+        assert len({decision for _, decision, *_ in results}) == 1
+        # The runner compacts in the background; its followers hold the uncompacted copy
+        runner = people[0]
+        assert runner.memory._task is not None and not runner.memory._task.done()
+        assert all(p.memory.entries == people[1].memory.entries for p in people[1:])
+        assert people[1].memory.entries[-1] == runner.memory.entries[-1]
+        await runner.memory.wait()
+
+    asyncio.run(main())
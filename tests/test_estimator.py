@@ -0,0 +1,127 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from config import EstimateConfig, TurnConfig
+from estimator import VoteShareEstimator, estimate_turn, stratified_order
+from llm import LLMClient, MockBackend
+from person import PersonV2
+
+OPTIONS = ["A", "B", "Undecided"]
+DEMOGRAPHICS = [[["X", 3], ["Y", 1]], [["P", 1], ["Q", 1]]]
+
+
+class StubSession:
+    """ Just enough of an MCPCache for call_llm when the mock never calls an MCP tool. """
+
+    async def tool_schemas(self):
+        return []
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_stratified_order_every_prefix_is_proportional(seed):
+    codes = np.array([[0]] * 60 + [[1]] * 30 + [[2]] * 10)
+    order = stratified_order(codes, seed)
+
+    assert sorted(order.tolist()) == list(range(len(codes)))
+    shares = np.array([0.6, 0.3, 0.1])
+    for k in range(1, len(codes) + 1):
+        counts = np.bincount(codes[order[:k], 0], minlength=3)
+        assert np.all(np.abs(counts - k * shares) < 2), (k, counts)
+
+
+def test_shares_are_exact_when_every_cell_is_fully_sampled():
+    estimator = VoteShareEstimator(DEMOGRAPHICS, OPTIONS)
+    # Per cell: (codes, votes for A, B, Undecided)
+    cells = {(0, 0): (3, 1, 0), (0, 1): (0, 4, 0), (1, 0): (2, 0, 2), (1, 1): (1, 1, 2)}
+    for codes, votes in cells.items():
+        for option, n in zip(OPTIONS, votes):
+            for _ in range(n):
+                estimator.add(codes, option)
+
+    codes = np.array(estimator.codes)
+    shares, half = estimator._shares(codes, np.array(estimator.choices))
+
+    # Cell weights are the products of the normalized feature weights
+    weight = {(0, 0): 0.375, (0, 1): 0.375, (1, 0): 0.125, (1, 1): 0.125}
+    expected = sum(w * np.array(cells[c]) / sum(cells[c]) for c, w in weight.items())
+    np.testing.assert_allclose(shares, expected)
+    assert shares.sum() == pytest.approx(1.0)
+    assert np.all(half > 0)
+
+
+def test_shares_ignore_how_unevenly_cells_were_sampled():
+    estimator = VoteShareEstimator(DEMOGRAPHICS, OPTIONS)
+    for _ in range(90):
+        estimator.add((0, 0), "A")
+    for _ in range(10):
+        estimator.add((1, 0), "B")
+
+    estimate = estimator.estimate()
+
+    # X is weighted 3:1 over Y, whatever the sample sizes
+    assert estimate["overall"]["A"]["share"] == pytest.approx(0.75)
+    assert estimate["overall"]["B"]["share"] == pytest.approx(0.25)
+    assert estimate["by_feature"]["Y"]["B"]["share"] == pytest.approx(1.0)
+    assert estimate["feature_samples"] == {"X": 90, "Y": 10, "P": 100}
+
+
+def test_converged_needs_min_samples():
+    estimator = VoteShareEstimator(DEMOGRAPHICS, OPTIONS)
+    for _ in range(50):
+        estimator.add((0, 0), "A")
+    estimate = estimator.estimate()
+
+    assert estimator.converged(estimate, EstimateConfig(target_width=1.0, min_samples=50))
+    assert not estimator.converged(estimate, EstimateConfig(target_width=1.0, min_samples=51))
+
+
+def _population(num_people, seed=0):
+    rng = np.random.default_rng(seed)
+    codes = np.stack([rng.choice(2, num_people, p=[0.75, 0.25]), rng.choice(2, num_people)], axis=1)
+    llm = LLMClient(MockBackend(OPTIONS, seed=seed))
+    people = []
+    for row in codes.tolist():
+        person = PersonV2([DEMOGRAPHICS[j][code][0] for j, code in enumerate(row)], llm=llm, memory_mode="fused")
+        person.options = OPTIONS
+        people.append(person)
+    return people, codes
+
+
+async def _run_estimate(people, codes, config):
+    estimator = VoteShareEstimator(DEMOGRAPHICS, OPTIONS, config.confidence)
+    order = stratified_order(codes, seed=0)
+    ids = [i async for i, *_ in estimate_turn(
+        people, codes, order, StubSession(), "day 1", estimator, config, TurnConfig(), turn=1)]
+    return estimator, order, ids
+
+
+def test_estimate_turn_stops_at_the_target_width():
+    people, codes = _population(2000)
+    config = EstimateConfig(target_width=0.2, batch_size=50, min_samples=50)
+
+    estimator, order, ids = asyncio.run(_run_estimate(people, codes, config))
+
+    estimate = estimator.estimate()
+    assert estimator.converged(estimate, config)
+    assert estimator.width(estimate) <= config.target_width
+    # Stopped early, after whole batches taken from the front of the order
+    assert len(ids) < len(people)
+    assert len(ids) % config.batch_size == 0
+    assert sorted(ids) == sorted(order[:len(ids)].tolist())
+    # ...and not a batch later than needed
+    previous = VoteShareEstimator(DEMOGRAPHICS, OPTIONS, config.confidence)
+    for i in ids[:len(ids) - config.batch_size]:
+        previous.add(codes[i], people[i].decision)
+    assert not previous.converged(previous.estimate(), config)
+
+
+def test_estimate_turn_runs_everyone_when_the_target_is_out_of_reach():
+    people, codes = _population(120)
+    config = EstimateConfig(target_width=0.001, batch_size=50, min_samples=50)
+
+    estimator, _, ids = asyncio.run(_run_estimate(people, codes, config))
+
+    assert sorted(ids) == list(range(len(people)))
+    assert not estimator.converged(estimator.estimate(), config)
@@ -0,0 +1,58 @@
+import json
+from types import SimpleNamespace
+
+import msgpack
+import numpy as np
+import pytest
+
+from results_store import JSON, MSGPACK, ResultsStore, encode
+
+DEMOGRAPHICS = [[["X", 1], ["Y", 1]]]
+
+
+def _store():
+    store = ResultsStore(DEMOGRAPHICS, [[0], [0], [1]], ["A", "B"])
+    store.record(1, [SimpleNamespace(decision=d) for d in ["A", "B", "A"]])
+    store.record(2, [SimpleNamespace(decision=d) for d in ["B", "B", "Undecided"]])
+    return store
+
+
+def test_tallies_crosstab_switches_and_series():
+    store = _store()
+
+    assert store.options == ["A", "B", "Undecided"]
+    assert store.tallies(1).tolist() == [2, 1, 0]
+    assert store.tallies().tolist() == [0, 2, 1]
+    assert store.crosstab(0, 1).tolist() == [[1, 1, 0], [1, 0, 0]]
+    assert store.switches(1).tolist() == [[0, 1, 1], [0, 1, 0], [0, 0, 0]]
+    assert store.series().tolist() == [[2, 1, 0], [0, 2, 1]]
+
+
+def test_record_replaces_a_turn_and_grows():
+    store = _store()
+    store.record(1, [SimpleNamespace(decision="A")] * 3)
+    for turn in range(3, 40):
+        store.record(turn, [SimpleNamespace(decision="B")] * 3)
+
+    assert store.turns == [1, 2] + list(range(3, 40))
+    assert store.tallies(1).tolist() == [3, 0, 0]
+    assert store.series().sum(axis=1).tolist() == [3] * len(store.turns)
+    with pytest.raises(KeyError):
+        store.decisions(99)
+
+
+def test_encode_json_and_msgpack():
+    payload = {"turn": np.int64(2), "tallies": _store().series()}
+
+    body, media_type = encode(payload, JSON)
+    assert media_type == "application/json"
+    assert json.loads(body) == {"turn": 2, "tallies": [[2, 1, 0], [0, 2, 1]]}
+
+    body, media_type = encode(payload, MSGPACK)
+    assert media_type == "application/msgpack"
+    packed = msgpack.unpackb(body)["tallies"]
+    array = np.frombuffer(packed["data"], dtype=packed["dtype"]).reshape(packed["shape"])
+    assert array.tolist() == [[2, 1, 0], [0, 2, 1]]
+
+    with pytest.raises(ValueError):
+        encode(payload, "csv")